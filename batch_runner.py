@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+前処理レシピのバッチ実行
+ブラウザに載らない大きさのCSVに、画面で作成したレシピをチャンク単位で適用する。
+平均値・最頻値・スケーラーのパラメータなど、ファイル全体を見ないと決まらない値は
+事前の学習パスで求めるため、出力は画面で実行した結果と一致する。
+
+使い方:
+    python batch_runner.py recipe.json input.csv -o output.csv
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+import operations
+from csv_loader import CHUNK_BYTES, iter_csv_chunks, numeric_dtype
+from recipes import OPERATIONS, load_recipe
+
+
+class _StreamStep:
+    """レシピの1ステップをチャンクごとに適用する。学習が不要な操作はこのクラスのまま使う"""
+    needs_fit = False
+
+    def __init__(self, step):
+        self.op = step['op']
+        self.params = dict(step['params'])
+        self.rows_seen = 0
+
+    def start_pass(self):
+        self.rows_seen = 0
+
+    def _is_first_row_excluded(self):
+        # 「最初のデータ行を除外する」はファイル全体の先頭行だけに適用する
+        return bool(self.params.get('exclude_first_row')) and self.rows_seen == 0
+
+    def _chunk_params(self):
+        params = dict(self.params)
+        if 'exclude_first_row' in params:
+            params['exclude_first_row'] = self._is_first_row_excluded()
+        return params
+
+    def transform(self, chunk):
+        params = self._chunk_params()
+        self.rows_seen += len(chunk)
+        return OPERATIONS[self.op](chunk, **params)
+
+    def partial_fit(self, chunk):
+        """学習用にチャンクを1つ受け取る。それ以上データが不要になったら True を返す"""
+        self.rows_seen += len(chunk)
+        return True
+
+    def finish_fit(self):
+        pass
+
+
+class _HeaderStep(_StreamStep):
+    needs_fit = True
+
+    def __init__(self, step):
+        super().__init__(step)
+        self.row = self.params['row']
+        self.header = None
+
+    def partial_fit(self, chunk):
+        if self.rows_seen + len(chunk) <= self.row:
+            self.rows_seen += len(chunk)
+            return False
+        self.header = operations.set_header(chunk, self.row - self.rows_seen).columns
+        return True
+
+    def finish_fit(self):
+        if self.header is None:
+            raise ValueError(f"指定された行番号 {self.row} はデータの範囲外です。")
+
+    def transform(self, chunk):
+        positions = np.arange(self.rows_seen, self.rows_seen + len(chunk))
+        self.rows_seen += len(chunk)
+        keep = positions > self.row
+        chunk = chunk[keep].copy()
+        chunk.columns = self.header
+        chunk.index = pd.Index(positions[keep] - (self.row + 1))
+        return chunk
+
+
+class _DuplicateStep(_StreamStep):
+    """これまでのチャンクに出現した行のハッシュを保持し、2回目以降の出現を削除する"""
+    def __init__(self, step):
+        super().__init__(step)
+        self.subset = self.params.get('subset')
+
+    def start_pass(self):
+        super().start_pass()
+        self.seen = np.array([], dtype=np.uint64)
+
+    def transform(self, chunk):
+        self.rows_seen += len(chunk)
+        hashes = operations.row_hashes(chunk, self.subset)
+        pos = np.searchsorted(self.seen, hashes).clip(max=max(len(self.seen) - 1, 0))
+        seen_before = (self.seen[pos] == hashes) if len(self.seen) else np.zeros(len(hashes), dtype=bool)
+        keep = ~seen_before & ~pd.Series(hashes).duplicated().to_numpy()
+        self.seen = np.union1d(self.seen, hashes[keep])
+        return chunk[keep]
+
+
+class _DuplicateKeepLastStep(_StreamStep):
+    """最後の出現を残す: 学習パスで全行のハッシュを集め、残す行の位置を決めておく"""
+    needs_fit = True
+
+    def __init__(self, step):
+        super().__init__(step)
+        self.subset = self.params.get('subset')
+
+    def start_pass(self):
+        super().start_pass()
+        self.hashes = []
+
+    def partial_fit(self, chunk):
+        self.rows_seen += len(chunk)
+        self.hashes.append(operations.row_hashes(chunk, self.subset))
+        return False
+
+    def finish_fit(self):
+        hashes = np.concatenate(self.hashes) if self.hashes else np.array([], dtype=np.uint64)
+        self.keep = ~pd.Series(hashes).duplicated(keep=self.params['keep']).to_numpy()
+        self.hashes = []
+
+    def transform(self, chunk):
+        keep = self.keep[self.rows_seen:self.rows_seen + len(chunk)]
+        self.rows_seen += len(chunk)
+        return chunk[keep]
+
+
+class _FillStep(_StreamStep):
+    """平均値・中央値・最頻値で埋める: 値をファイル全体から求めてから埋める"""
+    needs_fit = True
+
+    def __init__(self, step):
+        super().__init__(step)
+        self.method = self.params['method']
+        self.column = self.params['column']
+
+    def start_pass(self):
+        super().start_pass()
+        self.total = 0.0
+        self.count = 0
+        self.values = []
+        self.counts = None
+
+    def partial_fit(self, chunk):
+        target = chunk[self.column]
+        if self._is_first_row_excluded():
+            target = target.iloc[1:]
+        self.rows_seen += len(chunk)
+        if self.method == "平均値で埋める":
+            self.total += target.sum()
+            self.count += target.count()
+        elif self.method == "中央値で埋める":
+            self.values.append(target.dropna())
+        else:
+            counts = target.value_counts()
+            self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+        return False
+
+    def finish_fit(self):
+        if self.method == "平均値で埋める":
+            value = self.total / self.count if self.count else np.nan
+        elif self.method == "中央値で埋める":
+            value = pd.concat(self.values).median() if self.values else np.nan
+        else:
+            top = self.counts[self.counts == self.counts.max()]
+            value = top.index.sort_values()[0]
+        self.params['value'] = value
+
+
+class _OneHotStep(_StreamStep):
+    """ワンホットエンコーディング: 全チャンクで同じ列構成になるよう、カテゴリを先に集める"""
+    needs_fit = True
+
+    def start_pass(self):
+        super().start_pass()
+        # カテゴリは出現順に集め、並べ替えは finish_fit で get_dummies と同じ規則で行う
+        self.values = {col: {} for col in self.params['columns']}
+        self.counts = {col: None for col in self.params['columns']}
+
+    def partial_fit(self, chunk):
+        self.rows_seen += len(chunk)
+        for col in self.params['columns']:
+            values = chunk[col].cat.categories if isinstance(chunk[col].dtype, pd.CategoricalDtype) else chunk[col].dropna().unique()
+            self.values[col].update(dict.fromkeys(values))
+            counts = chunk[col].value_counts()
+            self.counts[col] = counts if self.counts[col] is None else self.counts[col].add(counts, fill_value=0)
+        return False
+
+    def finish_fit(self):
+        top_n, min_frequency = self.params.pop('top_n', None), self.params.pop('min_frequency', None)
+        other_label = self.params.get('other_label', operations.OTHER_LABEL)
+        self.params['categories'] = {col: operations.one_hot_vocabulary(self.counts[col], operations.one_hot_categories(pd.Series(list(values), dtype=object)), top_n, min_frequency, other_label)
+                                     for col, values in self.values.items()}
+
+
+class _ScaleStep(_StreamStep):
+    """正規化・標準化: スケーラーを partial_fit で学習してから変換する"""
+    needs_fit = True
+
+    def start_pass(self):
+        super().start_pass()
+        self.scaler = operations.make_scaler(self.params['method'])
+
+    def partial_fit(self, chunk):
+        self.rows_seen += len(chunk)
+        operations.fit_scaler(chunk, self.params['columns'], self.params['method'], scaler=self.scaler)
+        return False
+
+    def finish_fit(self):
+        self.params['scaler'] = self.scaler
+
+
+class _DivisionStep(_StreamStep):
+    """列の商: 割る数の0チェックはファイル全体で行う"""
+    needs_fit = True
+
+    def partial_fit(self, chunk):
+        self.rows_seen += len(chunk)
+        if (chunk[self.params['columns'][1]] == 0).any():
+            raise ValueError("割る数に0が含まれています。")
+        return False
+
+
+def _expand_steps(steps):
+    """複数列への一括処理は、1列ずつのステップを順に適用するのと同じ結果になるため、列ごとに分ける"""
+    for step in steps:
+        if step['op'] == 'apply_to_columns':
+            params = step['params']
+            for col in params['columns']:
+                yield {'op': params['operation'], 'params': dict(params['params'], column=col)}
+        else:
+            yield step
+
+
+def _make_stream_step(step):
+    if step['op'] == 'set_header':
+        return _HeaderStep(step)
+    if step['op'] == 'drop_duplicates':
+        return _DuplicateStep(step) if step['params'].get('keep', 'first') == 'first' else _DuplicateKeepLastStep(step)
+    if step['op'] == 'fill_missing' and step['params']['method'] in operations.FITTED_FILL_METHODS and step['params'].get('value') is None:
+        return _FillStep(step)
+    if step['op'] == 'one_hot_encode' and step['params'].get('categories') is None:
+        return _OneHotStep(step)
+    if step['op'] == 'scale' and step['params'].get('scaler') is None:
+        return _ScaleStep(step)
+    if step['op'] == 'column_arithmetic' and step['params']['operation'] == '列の商':
+        return _DivisionStep(step)
+    return _StreamStep(step)
+
+
+class RecipeRunner:
+    """CSVファイルにレシピをチャンク単位で適用する"""
+    def __init__(self, steps, chunk_bytes=CHUNK_BYTES, encoding=None, log=None):
+        self.steps = [_make_stream_step(step) for step in _expand_steps(steps)]
+        self.chunk_bytes = chunk_bytes
+        self.encoding = encoding
+        self.log = log or (lambda message: None)
+        self.dtypes = None
+        self.bad_lines = 0
+
+    def _raw_chunks(self, path):
+        with open(path, 'rb') as f:
+            for chunk, bad_lines in iter_csv_chunks(f, self.encoding, self.chunk_bytes):
+                self.bad_lines += bad_lines
+                yield chunk
+
+    def _fit_dtypes(self, path):
+        """画面での読み込みと同じく、ファイル全体で数値と解釈できる列だけを数値型にする"""
+        dtypes = {}
+        for chunk in self._raw_chunks(path):
+            for col in chunk.columns:
+                dtype = numeric_dtype(chunk[col])
+                if col not in dtypes:
+                    dtypes[col] = dtype
+                elif dtypes[col] is not None:
+                    dtypes[col] = None if dtype is None else np.result_type(dtypes[col], dtype)
+        self.dtypes = dtypes
+
+    def _chunks(self, path, steps):
+        """データ型を揃え、steps を適用したチャンクを順に返す"""
+        self.bad_lines = 0
+        for step in steps:
+            step.start_pass()
+        for chunk in self._raw_chunks(path):
+            for col, dtype in self.dtypes.items():
+                if dtype is not None and col in chunk.columns:
+                    chunk[col] = pd.to_numeric(chunk[col]).astype(dtype)
+            for step in steps:
+                chunk = step.transform(chunk)
+            yield chunk
+
+    def fit(self, path):
+        self.log("データ型を判定しています...")
+        self._fit_dtypes(path)
+        for i, step in enumerate(self.steps):
+            if not step.needs_fit:
+                continue
+            self.log(f"ステップ {i + 1} ({step.op}) の学習パス...")
+            step.start_pass()
+            for chunk in self._chunks(path, self.steps[:i]):
+                if step.partial_fit(chunk):
+                    break
+            step.finish_fit()
+        return self
+
+    def run(self, input_path, output_path, include_header=True):
+        """学習パスのあとにレシピを適用し、結果を output_path に書き出す。書き出した行数を返す"""
+        self.fit(input_path)
+        self.log("レシピを適用しています...")
+        rows = 0
+        with open(output_path, 'w', encoding='utf-8-sig', newline='') as f:
+            for i, chunk in enumerate(self._chunks(input_path, self.steps)):
+                chunk.to_csv(f, index=False, header=include_header and i == 0)
+                rows += len(chunk)
+        return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="前処理レシピをCSVファイルにチャンク単位で適用します。")
+    parser.add_argument('recipe', help="レシピファイル (JSON / YAML)")
+    parser.add_argument('input', help="入力CSVファイル")
+    parser.add_argument('-o', '--output', required=True, help="出力CSVファイル")
+    parser.add_argument('--chunk-mb', type=int, default=CHUNK_BYTES // 1024 ** 2, help="1チャンクあたりの読み込みサイズ (MB)")
+    parser.add_argument('--encoding', default=None, help="入力ファイルの文字コード（省略時は自動判定）")
+    parser.add_argument('--no-header', action='store_true', help="出力にヘッダー行を含めない")
+    args = parser.parse_args(argv)
+
+    with open(args.recipe, encoding='utf-8') as f:
+        steps = load_recipe(f.read())
+    runner = RecipeRunner(steps, chunk_bytes=args.chunk_mb * 1024 ** 2, encoding=args.encoding,
+                          log=lambda message: print(message, file=sys.stderr))
+    rows = runner.run(args.input, args.output, include_header=not args.no_header)
+    print(f"{rows} 行を {args.output} に書き出しました。", file=sys.stderr)
+    if runner.bad_lines:
+        print(f"列数が一致しない {runner.bad_lines} 行をスキップしました。", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
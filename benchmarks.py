@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+前処理の各操作のベンチマーク
+和暦・全角文字・欠損値・重複行を含む合成データを行数を変えて作成し、各操作の実行時間と
+ピークメモリを計測してJSONのレポートに書き出す。以前のレポートと比較して、遅くなった操作を検出できる。
+
+使い方:
+    python benchmarks.py --rows 10000 100000 1000000 -o report.json
+    python benchmarks.py --rows 10000 100000 -o new.json --compare report.json
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import operations
+from csv_loader import load_csv
+from exporters import export_bytes
+
+REPORT_VERSION = 1
+DEFAULT_ROWS = [10000, 100000, 1000000]
+POOL_SIZE = 5000
+MISSING_RATE = 0.05
+DUPLICATE_RATE = 0.05
+DEFAULT_REPEAT = 5
+REGRESSION_THRESHOLD = 1.2
+# これより小さい差は計測のばらつきとみなし、倍率を超えても悪化として報告しない
+REGRESSION_FLOORS = {'seconds': 0.005, 'peak_mb': 1.0}
+
+ERAS = [("令和", 2018, 2019, 2024), ("平成", 1988, 1989, 2018)]
+ZEN_DIGITS = str.maketrans("0123456789", "０１２３４５６７８９")
+
+
+def _date_pool(rng, size):
+    """和暦・西暦・全角数字の混じった日付文字列"""
+    pool = []
+    for i in range(size):
+        kind = i % 3
+        if kind == 0:
+            name, offset, start, end = ERAS[rng.integers(len(ERAS))]
+            year = int(rng.integers(start, end + 1))
+            pool.append(f"{name}{'元' if year - offset == 1 else year - offset}年{rng.integers(1, 13)}月{rng.integers(1, 29)}日")
+        elif kind == 1:
+            pool.append(f"{rng.integers(1990, 2025)}年{rng.integers(1, 13)}月{rng.integers(1, 29)}日")
+        else:
+            pool.append(f"{rng.integers(1990, 2025)}年{rng.integers(1, 13)}月{rng.integers(1, 29)}日".translate(ZEN_DIGITS))
+    return np.array(pool, dtype=object)
+
+
+def make_dataset(rows, seed=0):
+    """
+    画面でヘッダー行を指定した直後と同じく、すべての列が文字列の合成データを作る。
+    値は少数の候補から選ぶため、1000万行でも数秒で作成できる。
+    """
+    rng = np.random.default_rng(seed)
+    amounts = np.array([f"{v:,}円" if i % 2 else str(v) for i, v in enumerate(rng.integers(100, 1000000, POOL_SIZE))], dtype=object)
+    products = np.array([f"ＳＫＵ－{i:05d}".translate(ZEN_DIGITS) if i % 2 else f"sku-{i:05d}" for i in range(POOL_SIZE)], dtype=object)
+    shops = np.array(["Ａ店", "Ｂ店", " c店 ", "本店", "ｵﾝﾗｲﾝ"], dtype=object)
+    df = pd.DataFrame({
+        "日付": _date_pool(rng, POOL_SIZE)[rng.integers(0, POOL_SIZE, rows)],
+        "店舗": shops[rng.integers(0, len(shops), rows)],
+        "商品": products[rng.zipf(1.3, rows) % POOL_SIZE],
+        "金額": amounts[rng.integers(0, POOL_SIZE, rows)],
+        "数量": rng.integers(1, 100, rows).astype(str).astype(object),
+        "単価": np.round(rng.random(rows) * 1000, 2).astype(str).astype(object),
+    })
+    for col in df.columns:
+        df.loc[rng.random(rows) < MISSING_RATE, col] = None
+    # 既存の行を写して重複行を作る
+    duplicated = np.flatnonzero(rng.random(rows) < DUPLICATE_RATE)
+    df.iloc[duplicated] = df.iloc[rng.integers(0, rows, len(duplicated))].to_numpy()
+    return df
+
+
+def _benchmarks(df):
+    """(操作名, 引数なしで呼び出せる関数) のリスト。事前に必要な変換はここで済ませておく"""
+    csv_bytes = df.to_csv(index=False).encode('utf-8')
+    numeric = operations.optimize_dtypes(df[["数量", "単価"]], [
+        {'column': "数量", 'dtype': 'float64'}, {'column': "単価", 'dtype': 'float64'}])
+    return [
+        ("load_csv", lambda: load_csv(io.BytesIO(csv_bytes)).df),
+        ("convert_type", lambda: operations.convert_type(df, "金額", "数値 (float)")),
+        ("convert_date", lambda: operations.convert_date(df, "日付", "日本の形式 (例: 2023年1月1日, 令和5年1月1日)")),
+        ("clean_strings", lambda: operations.clean_strings(df, "商品", "全角英数記号を半角に変換")),
+        ("duplicated", lambda: operations.duplicated(df)),
+        ("one_hot_encode", lambda: operations.one_hot_encode(df, ["店舗"])),
+        ("scale", lambda: operations.scale(numeric, ["数量", "単価"], "標準化 (Standardization)")),
+        ("export_csv", lambda: export_bytes(df, "CSV")),
+    ]
+
+
+def _measure(func, repeat, memory):
+    """func の最短実行時間（秒）と、tracemalloc で計測したピークメモリ（MB）"""
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return min(seconds), peak_mb
+
+
+def run(rows_list, repeat=DEFAULT_REPEAT, memory=True, operations_filter=None, log=None):
+    log = log or (lambda message: None)
+    results = []
+    for rows in rows_list:
+        log(f"{rows} 行のデータを作成しています...")
+        df = make_dataset(rows)
+        for name, func in _benchmarks(df):
+            if operations_filter and name not in operations_filter:
+                continue
+            seconds, peak_mb = _measure(func, repeat, memory)
+            log(f"  {name}: {seconds:.3f} 秒" + (f", ピーク {peak_mb:.1f} MB" if peak_mb is not None else ""))
+            results.append({'operation': name, 'rows': rows, 'seconds': seconds, 'peak_mb': peak_mb})
+    return {
+        'version': REPORT_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD, floors=REGRESSION_FLOORS):
+    """
+    baseline と比べて実行時間（またはピークメモリ）が threshold 倍を超え、かつ差が floors の値以上の結果を返す。
+    戻り値は (操作名, 行数, 指標, 以前の値, 今回の値) のリスト。
+    """
+    previous = {(r['operation'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['operation'], result['rows']))
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            if result.get(metric) is None or not before.get(metric):
+                continue
+            if result[metric] > before[metric] * threshold and result[metric] - before[metric] >= floors.get(metric, 0):
+                regressions.append((result['operation'], result['rows'], metric, before[metric], result[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合成データで前処理の各操作の実行時間とメモリを計測します。")
+    parser.add_argument('--rows', type=lambda v: int(float(v)), nargs='+', default=DEFAULT_ROWS, help="データの行数（1e7 のような表記も可）")
+    parser.add_argument('-o', '--output', required=True, help="レポートの出力先 (JSON)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="各操作の実行回数（最短時間を記録）")
+    parser.add_argument('--no-memory', action='store_true', help="メモリを計測しない（tracemalloc を使わない分、速く終わる）")
+    parser.add_argument('--only', nargs='+', default=None, help="計測する操作を限定する")
+    parser.add_argument('--compare', default=None, help="比較する以前のレポート (JSON)")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="この倍率を超えて悪化した結果を報告する")
+    parser.add_argument('--min-seconds', type=float, default=REGRESSION_FLOORS['seconds'], help="これより小さい実行時間の差は悪化として報告しない（秒）")
+    args = parser.parse_args(argv)
+
+    report = run(args.rows, args.repeat, not args.no_memory, args.only, log=lambda message: print(message, file=sys.stderr))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"レポートを {args.output} に書き出しました。", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            floors = dict(REGRESSION_FLOORS, seconds=args.min_seconds)
+            regressions = compare(report, json.load(f), args.threshold, floors)
+        for operation, rows, metric, before, after in regressions:
+            print(f"悪化: {operation} ({rows} 行) {metric}: {before:.3f} → {after:.3f}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("以前のレポートより悪化した操作はありません。", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+CSV読み込みエンジン
+先頭バイトのサンプルから文字コードを判定し、レコードの境界で区切ったブロックごとにCエンジンでパースする。
+Cエンジンで解析できないブロックだけをPythonエンジンで読み直す。
+"""
+import io
+import warnings
+from dataclasses import dataclass
+
+import pandas as pd
+
+SAMPLE_SIZE = 1024 * 1024
+CANDIDATE_ENCODINGS = ('utf-8', 'cp932')
+CHUNK_BYTES = 64 * 1024 ** 2
+
+
+@dataclass
+class LoadResult:
+    """読み込み結果と、読み込み時の付随情報"""
+    df: pd.DataFrame
+    encoding: str
+    engine: str
+    bad_lines: int
+
+
+class _ProgressReader(io.RawIOBase):
+    """読み込んだバイト数を通知するファイルラッパー（pandasにはバイナリストリームとして渡す）"""
+    def __init__(self, raw, total_size, callback):
+        super().__init__()
+        self._raw = raw
+        self._total = total_size
+        self._callback = callback
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self._read += n
+        if self._callback is not None and self._total:
+            self._callback(min(self._read / self._total, 1.0))
+        return n
+
+
+def detect_encoding(sample):
+    """バイト列のサンプルから文字コードを判定する（UTF-8 → cp932 の順）"""
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError as e:
+            # サンプルの末尾でマルチバイト文字が途切れただけなら、その文字コードとみなす
+            if e.reason == 'unexpected end of data':
+                return encoding
+    return CANDIDATE_ENCODINGS[-1]
+
+
+def _infer_dtypes(df):
+    """文字列として読み込んだ列を、すべて数値として解釈できる場合のみ数値型に変換する"""
+    for col in df.columns:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def _file_size(file_obj):
+    size = getattr(file_obj, 'size', None)
+    if size is None:
+        pos = file_obj.tell()
+        size = file_obj.seek(0, io.SEEK_END)
+        file_obj.seek(pos)
+    return size
+
+
+def _read_c_engine(file_obj, encoding, size, progress_callback):
+    """Cエンジンでパースする。列数の合わない行は警告から件数を数えてスキップする"""
+    reader = _ProgressReader(file_obj, size, progress_callback)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        df = pd.read_csv(reader, header=None, encoding=encoding, dtype=str, on_bad_lines='warn')
+    bad_lines = sum(str(w.message).count('Skipping line') for w in caught if issubclass(w.category, pd.errors.ParserWarning))
+    return df, bad_lines
+
+
+def _read_python_engine(file_obj, encoding, size, progress_callback):
+    """Cエンジンで扱えないファイル（閉じていない引用符など）用の予備経路"""
+    reader = _ProgressReader(file_obj, size, progress_callback)
+    bad_lines = []
+    df = pd.read_csv(reader, header=None, encoding=encoding, dtype=str, engine='python',
+                     on_bad_lines=lambda line: bad_lines.append(line))
+    return df, len(bad_lines)
+
+
+def _record_boundary(buffer):
+    """引用符の外にある最後の改行の位置を返す（見つからなければ -1）"""
+    pos = buffer.rfind(b'\n')
+    while pos >= 0 and buffer.count(b'"', 0, pos) % 2:
+        pos = buffer.rfind(b'\n', 0, pos)
+    return pos
+
+
+def _parse_block(block, encoding, n_fields):
+    """
+    1ブロック分のバイト列をパースする。2ブロック目以降は列数 n_fields の空行を先頭に足してから読み込み、
+    ブロックの先頭行が列数の合わない行だった場合でも、ファイル全体を読んだときと同じ行をスキップさせる。
+    """
+    if n_fields is not None:
+        block = b'""' + (b',' * (n_fields - 1)) + b'\n' + block
+    try:
+        df, bad_lines = _read_c_engine(io.BytesIO(block), encoding, len(block), None)
+        engine = 'c'
+    except pd.errors.ParserError:
+        df, bad_lines = _read_python_engine(io.BytesIO(block), encoding, len(block), None)
+        engine = 'python'
+    if n_fields is not None:
+        df = df.iloc[1:]
+    return df, bad_lines, engine
+
+
+def _iter_blocks(file_obj, encoding, chunk_bytes):
+    """
+    レコードの境界で区切ったブロックを順にパースし、(DataFrame, スキップした行数, エンジン, 読み込んだバイト数) を返す。
+    Cエンジンで解析できないブロックだけをPythonエンジンで読み直す。
+    """
+    n_fields = None
+    offset = 0
+    consumed = 0
+    pending = b''
+    eof = False
+    while not eof:
+        data = file_obj.read(chunk_bytes)
+        eof = not data
+        consumed += len(data)
+        pending += data
+        if eof:
+            block, pending = pending, b''
+        else:
+            boundary = _record_boundary(pending)
+            if boundary < 0:
+                continue
+            block, pending = pending[:boundary + 1], pending[boundary + 1:]
+        if not block.strip():
+            continue
+        df, bad_lines, engine = _parse_block(block, encoding, n_fields)
+        if n_fields is None:
+            n_fields = len(df.columns)
+            # BOMは先頭ブロックにしかない
+            encoding = encoding.replace('-sig', '')
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        offset += len(df)
+        yield df, bad_lines, engine, consumed
+
+
+def iter_csv_chunks(file_obj, encoding=None, chunk_bytes=CHUNK_BYTES):
+    """
+    ブラウザに載らない大きさのCSVを、レコードの境界で区切ったブロックごとに読み込む。
+    ヘッダーなし・文字列のままの (DataFrame, スキップした行数) を順に返す。行番号は通しの連番になる。
+    """
+    if encoding is None:
+        start = file_obj.tell()
+        encoding = detect_encoding(file_obj.read(SAMPLE_SIZE))
+        file_obj.seek(start)
+    for df, bad_lines, _, _ in _iter_blocks(file_obj, encoding, chunk_bytes):
+        yield df, bad_lines
+
+
+def load_csv(file_obj, progress_callback=None, chunk_bytes=CHUNK_BYTES):
+    """
+    ヘッダーなしでCSVを読み込み、LoadResultを返す。
+    chunk_bytes ごとのブロックに分けて読み、列数の合わない行などでCエンジンが失敗したブロックだけをPythonエンジンで読む。
+    progress_callback には、ブロックを読み終えるたびに 0.0〜1.0 の進捗率が渡される。
+    """
+    size = _file_size(file_obj)
+    start = file_obj.tell()
+    encoding = detect_encoding(file_obj.read(SAMPLE_SIZE))
+
+    encodings = [encoding] + [e for e in CANDIDATE_ENCODINGS if e != encoding.replace('-sig', '')]
+    last_error = None
+    for enc in encodings:
+        file_obj.seek(start)
+        chunks, bad_lines, engine = [], 0, 'c'
+        try:
+            for df, block_bad_lines, block_engine, consumed in _iter_blocks(file_obj, enc, chunk_bytes):
+                chunks.append(df)
+                bad_lines += block_bad_lines
+                if block_engine == 'python':
+                    engine = 'python'
+                if progress_callback is not None and size:
+                    progress_callback(min(consumed / size, 1.0))
+        except UnicodeDecodeError as e:
+            # サンプル以降に判定と異なる文字コードのバイトが含まれていた場合は次の候補で再試行
+            last_error = e
+            continue
+        if not chunks:
+            raise pd.errors.EmptyDataError("No columns to parse from file")
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+        return LoadResult(df=_infer_dtypes(df), encoding=enc, engine=engine, bad_lines=bad_lines)
+    raise last_error
+
+
+def numeric_dtype(series):
+    """
+    文字列の列がすべて数値として解釈できる場合はその型を、できない場合は None を返す
+    （_infer_dtypes と同じ規則）。
+    """
+    try:
+        return pd.to_numeric(series).dtype
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+健康診断の統計量キャッシュ
+データの版番号と列ごとの最終変更版を記録し、統計量は変更された列だけ再計算する。
+"""
+import numpy as np
+import pandas as pd
+
+import operations
+
+TOP_N = 20
+MAX_BINS = 100
+SAMPLE_SIZE = 5000
+
+
+def _dense(series):
+    """疎な列（ワンホットエンコーディングの結果など）は、統計量を求めるために1列ずつ密な形に戻す"""
+    return series.sparse.to_dense() if isinstance(series.dtype, pd.SparseDtype) else series
+
+
+def dense_columns(df):
+    """疎な列を密な列に戻したデータフレーム（画面に表示する一部の行に使う）"""
+    sparse = [col for col in df.columns if isinstance(df[col].dtype, pd.SparseDtype)]
+    return df.astype({col: df[col].dtype.subtype for col in sparse}) if sparse else df
+
+
+class DataStats:
+    """
+    現在のデータフレームの統計量をキャッシュする。
+    データを差し替えるたびに update() を呼び、変更された列を伝える。
+    """
+    def __init__(self):
+        self.version = 0
+        self._column_versions = {}
+        self._column_cache = {}
+        self._frame_cache = {}
+        self._cacheable_memo = None
+
+    def update(self, old_df, new_df, columns=None):
+        """
+        データの差し替えを記録する。columns には値が変わった既存列を渡す（None の場合はすべての列）。
+        行が増減・並び替えされた場合は、すべての列が変更されたものとみなす。
+        """
+        self.version += 1
+        rows_changed = old_df is None or not old_df.index.equals(new_df.index)
+        versions = {}
+        for col in new_df.columns:
+            changed = rows_changed or columns is None or col in columns or col not in old_df.columns
+            versions[col] = self.version if changed else self._column_versions.get(col, self.version)
+        self._column_versions = versions
+        self._column_cache = {key: value for key, value in self._column_cache.items()
+                              if key[0] in versions and value[0] == versions[key[0]]}
+        self._frame_cache.clear()
+        self._cacheable_memo = None
+
+    def clear(self):
+        self.__init__()
+
+    def _cacheable(self, df):
+        """
+        df の統計量をキャッシュできるか（列名が一意で、記録している列と一致するか）。
+        列数の多いデータでも列ごとに調べ直さないよう、update() までは同じデータフレームに前回の結果を使う。
+        """
+        if self._cacheable_memo is not None and self._cacheable_memo[0] is df:
+            return self._cacheable_memo[1]
+        cacheable = df.columns.is_unique and len(df.columns) == len(self._column_versions) and all(col in self._column_versions for col in df.columns)
+        self._cacheable_memo = (df, cacheable)
+        return cacheable
+
+    def column_stat(self, df, col, name, func):
+        """列 col の統計量 name を返す。列が変更されていなければ前回の計算結果を使う"""
+        if not self._cacheable(df):
+            return func(df[col])
+        key = (col, name)
+        version = self._column_versions[col]
+        cached = self._column_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = func(df[col])
+        self._column_cache[key] = (version, value)
+        return value
+
+    def frame_stat(self, df, name, func):
+        """データ全体に対する統計量 name を返す。データが変更されていなければ前回の計算結果を使う"""
+        if not self._cacheable(df):
+            return func(df)
+        if name not in self._frame_cache:
+            self._frame_cache[name] = func(df)
+        return self._frame_cache[name]
+
+    def missing_count(self, df, col):
+        return self.column_stat(df, col, 'missing', lambda s: int(s.isnull().sum()))
+
+    def missing_counts(self, df):
+        """df.isnull().sum() と同じ結果"""
+        counts = [self.missing_count(df, col) for col in df.columns]
+        return pd.Series(counts, index=df.columns, dtype='int64')
+
+    def describe(self, df):
+        """df.describe(include='all') と同じ結果"""
+        if len(df.columns) == 0 or not self._cacheable(df):
+            return df.describe(include='all') if len(df.columns) else pd.DataFrame()
+        parts = [self.column_stat(df, col, 'describe', lambda s: _dense(s).describe()) for col in df.columns]
+        # 行の並びは pandas の describe と同じく、項目数の少ない列の順に集める
+        names = []
+        for index in sorted((part.index for part in parts), key=len):
+            names.extend(name for name in index if name not in names)
+        result = pd.concat([part.reindex(names) for part in parts], axis=1, sort=False)
+        result.columns = df.columns
+        return result
+
+    def value_counts(self, df, col, n=TOP_N):
+        """列 col の出現回数の上位 n 件"""
+        return self.column_stat(df, col, f'value_counts_{n}', lambda s: s.value_counts().nlargest(n))
+
+    def histogram(self, df, col, max_bins=MAX_BINS):
+        """
+        数値列のヒストグラム（度数, ビンの境界）。ビンの数は NumPy の 'auto' で決め、max_bins を上限とする。
+        ブラウザにはデータではなく集計結果だけを送る。
+        """
+        def compute(s):
+            values = s.to_numpy(dtype=float, na_value=np.nan)
+            values = values[np.isfinite(values)]
+            if len(values) == 0:
+                return np.array([], dtype=np.int64), np.array([], dtype=float)
+            edges = np.histogram_bin_edges(values, bins='auto')
+            if len(edges) - 1 > max_bins:
+                edges = np.histogram_bin_edges(values, bins=max_bins)
+            return np.histogram(values, bins=edges)
+        return self.column_stat(df, col, f'histogram_{max_bins}', compute)
+
+    def sample(self, df, n=SAMPLE_SIZE):
+        """散布図・箱ひげ図用に行を n 行まで無作為に抽出する。データが変わらない限り同じ行を返す"""
+        if len(df) <= n:
+            return df
+        index = self.frame_stat(df, f'sample_{n}', lambda d: d.sample(n=n, random_state=0).sort_index().index)
+        return df.loc[index]
+
+    def row_hashes(self, df, subset=None):
+        """行ごとのハッシュ。列のハッシュは列が変更されるまで使い回す"""
+        key = tuple(subset) if subset else None
+        hash_column = lambda s: self.column_stat(df, s.name, 'hash', operations.column_hash)
+        return self.frame_stat(df, ('row_hashes', key), lambda d: operations.row_hashes(d, subset, hash_column))
+
+    def duplicated(self, df, subset=None, keep='first'):
+        return operations.duplicated(df, subset, keep, hashes=self.row_hashes(df, subset))
+
+    def duplicate_count(self, df, subset=None):
+        """重複行（2回目以降の出現）の数。keep='first' でも 'last' でも同じ数になる"""
+        key = tuple(subset) if subset else None
+        return self.frame_stat(df, ('duplicates', key), lambda d: int(self.duplicated(d, subset).sum()))
+
+    def duplicate_groups(self, df, subset=None, n_groups=5):
+        """重複している行のグループを先頭から n_groups 個だけ取り出す（グループ番号の列を先頭に付ける）"""
+        hashes = pd.Series(self.row_hashes(df, subset))
+        duplicated = hashes.duplicated(keep=False).to_numpy()
+        groups = hashes[duplicated].unique()[:n_groups]
+        positions = np.flatnonzero(duplicated & hashes.isin(groups).to_numpy())
+        group_ids = pd.Categorical(hashes.iloc[positions], categories=groups).codes + 1
+        order = np.argsort(group_ids, kind='stable')
+        sample = df.iloc[positions[order]].copy()
+        sample.insert(0, "重複グループ", group_ids[order], allow_duplicates=True)
+        return sample
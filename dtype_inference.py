@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+データ型の自動推定
+ヘッダー行を指定した直後はすべての列が object 型（文字列）のままなので、
+各列のサンプルから整数・小数・日付・真偽値・カテゴリを推定し、できるだけ小さい型を提案する。
+"""
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from operations import BOOL_VALUES, cast_column
+
+SAMPLE_SIZE = 10000
+CATEGORY_RATIO = 0.5
+INT_DTYPES = ['int8', 'int16', 'int32', 'int64']
+
+
+def _smallest_int(values, nullable):
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if values.min() >= info.min and values.max() <= info.max:
+            return dtype.capitalize() if nullable else dtype
+    return None
+
+
+def _infer_numeric(values, nullable):
+    """欠損を除いた数値から、値を変えずに表せる最も小さい型を返す"""
+    floats = values.to_numpy(dtype=float)
+    if not np.isfinite(floats).all():
+        return 'float64'
+    if pd.api.types.is_integer_dtype(values) or (floats % 1 == 0).all():
+        return _smallest_int(values.to_numpy(dtype=float), nullable) or 'float64'
+    if (floats.astype('float32').astype('float64') == floats).all():
+        return 'float32'
+    return 'float64'
+
+
+def infer_column(series, sample_size=SAMPLE_SIZE):
+    """
+    列のデータ型を推定し、(データ型, 日付の書式) を返す。推定はサンプルで行い、変換の可否は cast_column で全体を確認する。
+    提案する型がない場合は None を返す。
+    """
+    non_null = series.dropna()
+    if non_null.empty or pd.api.types.is_bool_dtype(series) or not (series.dtype == object or pd.api.types.is_numeric_dtype(series)):
+        return None
+    sample = non_null.sample(n=sample_size, random_state=0) if len(non_null) > sample_size else non_null
+    nullable = len(non_null) < len(series)
+    if series.dtype != object:
+        return _infer_numeric(non_null, nullable), None
+
+    text = sample.astype(str).str.strip()
+    if text.str.lower().isin(list(BOOL_VALUES)).all():
+        return ('boolean' if nullable else 'bool'), None
+    if pd.to_numeric(sample, errors='coerce').notna().all():
+        numeric = pd.to_numeric(non_null, errors='coerce')
+        if numeric.notna().all():
+            return _infer_numeric(numeric, nullable), None
+    date_format = guess_datetime_format(text.iloc[0])
+    if date_format and pd.to_datetime(text, format=date_format, errors='coerce').notna().all():
+        return 'datetime64[ns]', date_format
+    if non_null.nunique() <= len(non_null) * CATEGORY_RATIO:
+        return 'category', None
+    return None
+
+
+def infer_dtypes(df, sample_size=SAMPLE_SIZE):
+    """
+    すべての列のデータ型を推定する。
+    operations.optimize_dtypes に渡す変換のリストと、変換前後のメモリ使用量の表を返す。
+    """
+    conversions = []
+    rows = []
+    for col in df.columns:
+        series = df[col]
+        inferred = infer_column(series, sample_size)
+        if inferred is None or inferred[0] == str(series.dtype):
+            continue
+        dtype, date_format = inferred
+        try:
+            converted = cast_column(series, dtype, date_format)
+        except (ValueError, TypeError, OverflowError):
+            continue
+        before = series.memory_usage(deep=True, index=False)
+        after = converted.memory_usage(deep=True, index=False)
+        if after > before:
+            continue
+        conversions.append({'column': col, 'dtype': dtype, 'format': date_format})
+        rows.append([str(col), str(series.dtype), dtype, before / 1024 ** 2, after / 1024 ** 2])
+    report = pd.DataFrame(rows, columns=["列", "現在の型", "推定した型", "変換前 (MB)", "変換後 (MB)"])
+    return conversions, report
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+処理済みデータの書き出し
+CSVはチャンクごとに一時ファイルへ書き込み、データ全体の文字列をメモリ上に作らない。
+Parquet / Feather はカテゴリ型や Int64 型などのデータ型を保ったまま保存できる。
+"""
+import codecs
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:  # Parquet / Feather は pyarrow がインストールされている場合のみ対応
+    pyarrow = None
+
+ARROW_AVAILABLE = pyarrow is not None
+CSV_CHUNK_ROWS = 100000
+SPOOL_MAX_BYTES = 64 * 1024 ** 2
+PARQUET_COMPRESSIONS = ["snappy", "zstd", "gzip", "なし"]
+FEATHER_COMPRESSIONS = ["lz4", "zstd", "なし"]
+EXPORT_FORMATS = {
+    "CSV": ('.csv', 'text/csv'),
+    "Parquet": ('.parquet', 'application/vnd.apache.parquet'),
+    "Feather (Arrow IPC)": ('.feather', 'application/vnd.apache.arrow.file'),
+}
+
+
+def write_csv(df, f, include_header=True, chunk_rows=CSV_CHUNK_ROWS):
+    """BOM付きUTF-8のCSVを、chunk_rows 行ずつバイナリファイル f に書き込む"""
+    f.write(codecs.BOM_UTF8)
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        f.write(chunk.to_csv(index=False, header=include_header and start == 0).encode('utf-8'))
+
+
+def _arrow_compatible(df):
+    """
+    Arrow形式で保存できるように整える。列名は文字列にし、疎な列は密な列に戻し、
+    型の混在したobject列は文字列にそろえる（数値への変換に失敗した値が残った列など）。
+    """
+    df = df.reset_index(drop=True)
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.SparseDtype):
+            df[col] = df[col].sparse.to_dense()
+        elif df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].astype(str).where(df[col].notna())
+    return df
+
+
+def write_parquet(df, f, compression="snappy"):
+    if pyarrow is None:
+        raise RuntimeError("Parquet形式で保存するには pyarrow をインストールしてください。")
+    _arrow_compatible(df).to_parquet(f, index=False, compression=None if compression == "なし" else compression)
+
+
+def write_feather(df, f, compression="lz4"):
+    if pyarrow is None:
+        raise RuntimeError("Feather形式で保存するには pyarrow をインストールしてください。")
+    _arrow_compatible(df).to_feather(f, compression='uncompressed' if compression == "なし" else compression)
+
+
+def export_bytes(df, fmt, include_header=True, compression=None):
+    """
+    df を fmt の形式で書き出したバイト列を返す。
+    書き出しは一時ファイル（一定サイズまではメモリ上）に行い、最後に一度だけ読み出す。
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as f:
+        if fmt == "CSV":
+            write_csv(df, f, include_header)
+        elif fmt == "Parquet":
+            write_parquet(df, f, compression or PARQUET_COMPRESSIONS[0])
+        elif fmt == "Feather (Arrow IPC)":
+            write_feather(df, f, compression or FEATHER_COMPRESSIONS[0])
+        else:
+            raise ValueError(f"未対応の形式です: {fmt}")
+        f.seek(0)
+        return f.read()
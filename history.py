@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+元に戻す／やり直す の操作履歴
+各ステップはデータフレーム全体のコピーではなく、変化した列と行だけを差分として保持する。
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+def _nbytes(obj):
+    if obj is None:
+        return 0
+    usage = obj.memory_usage(deep=True, index=False)
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+
+@dataclass
+class _Delta:
+    """
+    あるデータフレーム (src) から別のデータフレーム (dst) を復元するための差分。
+    data には src から再利用できない dst の列、row_mask には dst に残る src の行、
+    extra_rows には src にない dst の行を持つ。差分で表せない場合は snapshot に全体を持つ。
+    snapshot は操作が元のデータフレームを変更しないことを前提に参照として保持する。data の列はコピーする
+    （参照のままだと、列を含むブロック全体が残り続け、メモリ使用量が nbytes を大きく上回るため）。
+    """
+    columns: pd.Index
+    index: pd.Index
+    data: dict = field(default_factory=dict)
+    row_mask: np.ndarray = None
+    extra_rows: pd.DataFrame = None
+    snapshot: pd.DataFrame = None
+
+    @property
+    def nbytes(self):
+        total = sum(_nbytes(s) for s in self.data.values()) + _nbytes(self.extra_rows) + _nbytes(self.snapshot)
+        if self.row_mask is not None or self.extra_rows is not None:
+            total += self.index.memory_usage(deep=True)
+        return total
+
+    def apply(self, src):
+        if self.snapshot is not None:
+            return self.snapshot
+        columns = {}
+        for col in self.columns:
+            if col in self.data:
+                columns[col] = self.data[col]
+                continue
+            s = src[col]
+            if self.row_mask is not None:
+                s = s[self.row_mask]
+            if self.extra_rows is not None:
+                s = pd.concat([s, self.extra_rows[col]]).reindex(self.index)
+            columns[col] = s
+        restored = pd.DataFrame(columns, index=self.index)
+        restored.columns = self.columns
+        return restored
+
+
+def _make_delta(src, dst, columns=None):
+    """
+    src から dst を作るための差分を求める。
+    columns を指定した場合、両方に存在する列のうちそれ以外の列は値が変わっていないものとみなす。
+    """
+    def snapshot():
+        return _Delta(columns=dst.columns, index=dst.index, snapshot=dst)
+
+    if not (src.columns.is_unique and dst.columns.is_unique and src.index.is_unique and dst.index.is_unique):
+        return snapshot()
+
+    row_mask = None
+    extra_mask = None
+    if src.index.equals(dst.index):
+        def src_aligned(col): return src[col]
+        def dst_aligned(col): return dst[col]
+    else:
+        in_dst = src.index.isin(dst.index)
+        in_src = dst.index.isin(src.index)
+        if in_src.all() and src.index[in_dst].equals(dst.index):
+            # 行の削除: 残った行の位置を記録する
+            row_mask = in_dst
+            def src_aligned(col): return src[col][row_mask]
+            def dst_aligned(col): return dst[col]
+        elif in_dst.all() and dst.index[in_src].equals(src.index):
+            # 行の追加（行削除の取り消し）: 追加された行だけを保持する
+            extra_mask = ~in_src
+            def src_aligned(col): return src[col]
+            def dst_aligned(col): return dst[col][in_src]
+        else:
+            return snapshot()
+
+    data = {}
+    reused = []
+    for col in dst.columns:
+        if col in src.columns and (columns is None or col not in columns):
+            if columns is not None or (src[col].dtype == dst[col].dtype and src_aligned(col).equals(dst_aligned(col))):
+                reused.append(col)
+                continue
+        data[col] = dst[col].copy()
+    extra_rows = dst.loc[extra_mask, reused] if extra_mask is not None else None
+    return _Delta(columns=dst.columns, index=dst.index, data=data, row_mask=row_mask, extra_rows=extra_rows)
+
+
+class _Step:
+    """履歴の1ステップ。メモリ上限で差分を破棄しても、ラベルとレシピのステップは残す"""
+    def __init__(self, label, delta, columns=None, recipe_step=None):
+        self.label = label
+        self.delta = delta
+        self.columns = columns
+        self.recipe_step = recipe_step
+        self.nbytes = delta.nbytes
+
+    def evict(self):
+        self.delta = None
+        self.nbytes = 0
+
+
+class DataHistory:
+    """
+    データフレームの変更履歴を管理する。
+    保持している差分の合計が max_bytes を超えた場合は、古いステップから削除する。
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self._max_bytes = max_bytes
+        self._undo = []
+        self._redo = []
+        self.last_columns = None
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        self._max_bytes = value
+        self._enforce_budget()
+
+    def push(self, old_df, new_df, label, columns=None, recipe_step=None):
+        """old_df から new_df への変更を記録する。redoの履歴は破棄される"""
+        self._undo.append(_Step(label, _make_delta(new_df, old_df, columns), columns, recipe_step))
+        self._redo.clear()
+        self._enforce_budget()
+
+    def undo(self, df):
+        """1ステップ前のデータフレームを返す"""
+        step = self._undo.pop()
+        previous = step.delta.apply(df)
+        self.last_columns = step.columns
+        self._redo.append(_Step(step.label, _make_delta(previous, df, step.columns), step.columns, step.recipe_step))
+        self._enforce_budget()
+        return previous
+
+    def redo(self, df):
+        """取り消したステップを再適用したデータフレームを返す"""
+        step = self._redo.pop()
+        following = step.delta.apply(df)
+        self.last_columns = step.columns
+        self._undo.append(_Step(step.label, _make_delta(following, df, step.columns), step.columns, step.recipe_step))
+        self._enforce_budget()
+        return following
+
+    def undo_all(self, df):
+        """保持している最も古い状態まで戻す"""
+        columns = set()
+        while self.can_undo:
+            df = self.undo(df)
+            columns = None if columns is None or self.last_columns is None else columns | set(self.last_columns)
+        self.last_columns = None if columns is None else list(columns)
+        return df
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+
+    @property
+    def can_undo(self):
+        return bool(self._undo) and self._undo[-1].delta is not None
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    @property
+    def undo_labels(self):
+        return [step.label for step in self._undo]
+
+    @property
+    def redo_labels(self):
+        return [step.label for step in self._redo]
+
+    @property
+    def evicted(self):
+        """メモリ上限のため取り消せなくなったステップの数"""
+        return sum(step.delta is None for step in self._undo)
+
+    @property
+    def recipe(self):
+        """現在のデータに至るまでに実行した操作のレシピ"""
+        return [step.recipe_step for step in self._undo if step.recipe_step is not None]
+
+    @property
+    def nbytes(self):
+        return sum(step.nbytes for step in self._undo + self._redo)
+
+    def _enforce_budget(self):
+        for step in self._undo:
+            if self.nbytes <= self.max_bytes:
+                break
+            step.evict()
+        while self._redo and self.nbytes > self.max_bytes:
+            self._redo.pop(0)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+和暦・西暦の「年月日」表記の日付変換エンジン
+Seriesをまとめて正規表現で分解し、ユニークな文字列ごとに1回だけ変換する。
+"""
+import numpy as np
+import pandas as pd
+
+ERA_NAMES = np.array(['令和', '平成', '昭和', '大正', '明治'])
+ERA_OFFSETS = np.array([2018, 1988, 1925, 1911, 1867])
+
+# 元号(任意)・年・月(任意)・日(任意) を取り出し、残りを tail に入れる
+DATE_PATTERN = (
+    r'^(?P<era>' + '|'.join(ERA_NAMES) + r')?(?P<year>\d+)年'
+    r'(?:(?P<month>\d+)月(?:(?P<day>\d+)日)?)?(?P<tail>.*)$'
+)
+
+
+def _parse_unique(texts):
+    """重複のない文字列のSeriesを変換する"""
+    texts = texts.str.replace('元年', '1年', regex=False)
+    parts = texts.str.extract(DATE_PATTERN)
+    well_formed = parts['tail'] == ''
+    year = pd.to_numeric(parts['year'])
+    month = pd.to_numeric(parts['month'])
+    day = pd.to_numeric(parts['day'])
+
+    era_codes = pd.Categorical(parts['era'], categories=ERA_NAMES).codes
+    is_era = era_codes >= 0
+
+    # 西暦: 4桁の年と1〜2桁の月・日のみ受け付ける（%Y年%m月%d日 / %Y年%m月 / %Y年 と同じ範囲）
+    is_western = (
+        ~is_era & well_formed & (parts['year'].str.len() == 4)
+        & (parts['month'].isna() | (parts['month'].str.len() <= 2))
+        & (parts['day'].isna() | (parts['day'].str.len() <= 2))
+    )
+    # 和暦: 月日が読み取れない場合は、その年の1月1日とする
+    era_has_month = is_era & well_formed & month.notna()
+
+    year = year.where(~is_era, year + ERA_OFFSETS[np.where(is_era, era_codes, 0)])
+    use_month_day = is_western | era_has_month
+    ymd = pd.DataFrame({
+        'year': year.where(is_western | is_era),
+        'month': month.where(use_month_day, 1).fillna(1),
+        'day': day.where(use_month_day, 1).fillna(1),
+    })
+    result = pd.to_datetime(ymd, errors='coerce')
+
+    # 和暦で月日が不正な日付（2月30日など）だった場合も1月1日に戻す
+    era_fallback = is_era & result.isna()
+    if era_fallback.any():
+        jan_first = pd.to_datetime(pd.DataFrame({'year': year, 'month': 1, 'day': 1}).where(era_fallback), errors='coerce')
+        result = result.fillna(jan_first)
+    return result
+
+
+def parse_japanese_dates(s):
+    """
+    「2023年1月1日」「令和5年1月」「平成元年」などの文字列Seriesをdatetimeに変換する。
+    変換できない値は NaT になる。
+    """
+    codes, uniques = pd.factorize(s)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=s.index, dtype='datetime64[ns]')
+    parsed = _parse_unique(pd.Series(uniques, dtype=object).astype(str)).to_numpy()
+    values = np.where(codes >= 0, parsed[codes], np.datetime64('NaT'))
+    return pd.Series(values, index=s.index, dtype='datetime64[ns]')
@@ -0,0 +1,636 @@
+# -*- coding: utf-8 -*-
+"""
+前処理の各操作
+Streamlitに依存しない純粋な関数として実装し、画面とバッチ実行の両方から呼び出す。
+各関数は元のデータフレームを変更せず、新しいデータフレームを返す。
+"""
+import numbers
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from japanese_dates import parse_japanese_dates
+from text_normalize import zen_to_han
+
+FILL_METHODS = ["平均値で埋める", "中央値で埋める", "最頻値で埋める", "指定した値で埋める", "行ごと削除する"]
+FITTED_FILL_METHODS = ["平均値で埋める", "中央値で埋める", "最頻値で埋める"]
+TYPE_OPTIONS = ["数値 (int)", "数値 (float)", "文字列 (str)", "カテゴリカル (category)"]
+DATE_FORMATS = ["標準的な形式 (例: 2023-01-01, 2023/1/1)", "日時形式 (YYYY-MM-DD HH:MM:SS)", "日本の形式 (例: 2023年1月1日, 令和5年1月1日)", "区切り文字なし (例: 20230101)", "Excelのシリアル値 (例: 45123)"]
+CLEAN_OPTIONS = ["前後の空白を削除", "すべて小文字に変換", "すべて大文字に変換", "全角英数記号を半角に変換"]
+SCALING_METHODS = ["最小最大正規化 (Min-Max Scaling)", "標準化 (Standardization)"]
+ARITHMETIC_OPERATIONS = ["列の合計", "列の積", "列の差", "列の商"]
+BOOL_VALUES = {'true': True, 'false': False}
+PROCESS_MIN_CELLS = 1000000
+OTHER_LABEL = "その他"
+DUMMY_DTYPES = ["float64", "uint8", "bool"]
+# 密な形式のダミー列の推定メモリ使用量がこれを超える場合は、実行前に確認する
+ONE_HOT_DENSE_WARN_BYTES = 512 * 1024 ** 2
+SCALE_DTYPES = ["float64", "float32"]
+SCALE_CHUNK_ROWS = 100000
+# 数値への変換で取り除く文字（桁区切り、円、% などの単位）
+NON_NUMERIC_PATTERN = re.compile(r'[^\d.-]')
+
+
+def _target_slice(series, exclude_first_row):
+    """「最初のデータ行を処理から除外する」が指定された場合は0行目を除いた部分を返す"""
+    return series.iloc[1:] if exclude_first_row and len(series) > 0 else series
+
+
+def _common_dtype(*series):
+    """すべての Series の値を表せるデータ型（カテゴリ型と文字列なら object 型、Int8 と float64 なら Float64 など）"""
+    return pd.concat([s.iloc[:0] for s in series]).dtype
+
+
+def _updated(series, values, start=None):
+    """
+    series を values で上書きした新しいSeries。series の型に収まらない値の場合は型を広げてから上書きする。
+    start を指定した場合は、インデックスではなく位置で対応させ、start 行目以降を上書きする。
+    """
+    dtype = _common_dtype(series, values)
+    final_series = series.astype(dtype) if dtype != series.dtype else series.copy()
+    if start is None:
+        final_series.update(values)
+        return final_series
+    index = final_series.index
+    final_series.index = pd.RangeIndex(len(final_series))
+    final_series.update(pd.Series(values.array, index=pd.RangeIndex(start, start + len(values)), copy=False))
+    final_series.index = index
+    return final_series
+
+
+def _widened(series):
+    """演算であふれないよう、小さい数値型を64ビットの型に戻す"""
+    if not pd.api.types.is_numeric_dtype(series):
+        return series
+    if isinstance(series.dtype, pd.SparseDtype):
+        series = series.sparse.to_dense()
+    if pd.api.types.is_extension_array_dtype(series):
+        return series.astype('Int64' if pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series) else 'Float64')
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_signed_integer_dtype(series) or (pd.api.types.is_unsigned_integer_dtype(series) and series.dtype.itemsize < 8):
+        return series.astype('int64')
+    return series.astype('float64')
+
+
+def set_header(df, row):
+    """指定行を新しいヘッダーにし、それより上の行を削除する"""
+    if row >= len(df):
+        raise ValueError(f"指定された行番号 {row} はデータの範囲外です。このデータは {len(df)} 行（0から{len(df)-1}まで）しかありません。")
+    potential_header = df.iloc[row].astype(str).fillna('untitled')
+    if potential_header.duplicated().any():
+        duplicates = potential_header[potential_header.duplicated()].unique().tolist()
+        raise ValueError(f"{row}行目には重複した値が含まれているため、ヘッダーとして設定できません。重複している値: {duplicates}")
+    df_copy = df.iloc[row + 1:].copy()
+    df_copy.columns = potential_header
+    df_copy.reset_index(drop=True, inplace=True)
+    return df_copy
+
+
+def drop_columns(df, columns):
+    return df.drop(columns=columns)
+
+
+def _hash_key(value):
+    """
+    object型の列の値を、(型の名前, 値) にする。df.duplicated と同じく True・1・1.0 は等しいものとして扱うため、
+    数値はまとめて 'number' とし、整数と等しい小数は整数にそろえる。
+    """
+    if isinstance(value, (bool, np.bool_, int, np.integer)):
+        return 'number', int(value)
+    if isinstance(value, (float, np.floating)):
+        return 'number', int(value) if value.is_integer() else value
+    return type(value).__name__, value
+
+
+def _type_name_hashes(type_names):
+    """型名のハッシュ（種類が少ないので、種類ごとに1回だけ求める）"""
+    codes, uniques = pd.factorize(np.asarray(type_names, dtype=object))
+    return pd.util.hash_pandas_object(pd.Series(uniques, dtype=object), index=False).to_numpy()[codes]
+
+
+def column_hash(series):
+    """
+    列の各値の64ビットハッシュ。object型の列は、文字列の '1' と数値の 1 を区別するため型名もハッシュに含める。
+    ハッシュは値だけで決まり、同じ列の他の値（バッチ実行ではチャンクの中身）には依存しない。
+    """
+    if series.dtype != object:
+        return pd.util.hash_pandas_object(series, index=False).to_numpy()
+    if pd.api.types.infer_dtype(series, skipna=True) == 'string':
+        # 文字列だけの列は値をそのまま使い、型名が 'str' でないのは欠損値だけ
+        values = series
+        type_hashes = np.full(len(series), _type_name_hashes(['str'])[0])
+        missing = series.isna().to_numpy()
+        if missing.any():
+            type_hashes[missing] = _type_name_hashes([type(v).__name__ for v in series.to_numpy()[missing]])
+    else:
+        keys = [_hash_key(v) for v in series.to_numpy()]
+        values = pd.Series([k[1] for k in keys], dtype=object)
+        type_hashes = _type_name_hashes([k[0] for k in keys])
+    return combine_hashes([pd.util.hash_pandas_object(values, index=False).to_numpy(), type_hashes])
+
+
+def combine_hashes(hashes):
+    """列ごとのハッシュを行ごとのハッシュにまとめる（pandasの hash_pandas_object と同じ混ぜ方）"""
+    hashes = list(hashes)
+    if len(hashes) == 1:
+        return hashes[0]
+    mult = np.uint64(1000003)
+    out = np.full(len(hashes[0]), np.uint64(0x345678))
+    for i, h in enumerate(hashes):
+        out ^= h
+        out *= mult
+        mult += np.uint64(82520 + 2 * (len(hashes) - i - 1))
+    return out + np.uint64(97531)
+
+
+def row_hashes(df, subset=None, hash_column=column_hash):
+    """行ごとのハッシュ。subset を指定した場合はその列だけから求める"""
+    columns = list(subset) if subset else list(df.columns)
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    return combine_hashes(hash_column(df[col]) for col in columns)
+
+
+def duplicated(df, subset=None, keep='first', hashes=None):
+    """df.duplicated(subset, keep) の行ハッシュ版。keep は 'first' / 'last' / False"""
+    if hashes is None:
+        hashes = row_hashes(df, subset)
+    return pd.Series(hashes, index=df.index).duplicated(keep=keep)
+
+
+def drop_duplicates(df, subset=None, keep='first'):
+    """重複行を削除する。subset を指定した場合はその列の値が一致する行を重複とみなす"""
+    return df[~duplicated(df, subset, keep).to_numpy()]
+
+
+def fill_value(series, method):
+    """平均値・中央値・最頻値で埋める場合の値を求める"""
+    if method == "平均値で埋める": return series.mean(numeric_only=True)
+    if method == "中央値で埋める": return series.median(numeric_only=True)
+    if method == "最頻値で埋める": return series.mode()[0]
+    raise ValueError(f"未対応の欠損値処理です: {method}")
+
+
+def fill_missing(df, column, method, value=None, exclude_first_row=False):
+    """
+    欠損値を処理する。平均値・中央値・最頻値の場合、value を省略するとデータから求める
+    （バッチ実行ではファイル全体から求めた値を渡す）。
+    """
+    target = _target_slice(df[column], exclude_first_row)
+    if method == "行ごと削除する":
+        return df.drop(target[target.isnull()].index)
+    if method in FITTED_FILL_METHODS and value is None:
+        value = fill_value(target, method)
+    if method == "指定した値で埋める" and not value:
+        return df.copy()
+    df_copy = df.copy()
+    target = target.astype(_common_dtype(target, pd.Series([value])))
+    df_copy[column] = _updated(df_copy[column], target.fillna(value))
+    return df_copy
+
+
+def _clean_numbers(series):
+    """
+    文字を取り除いて数値に変換する。全角英数記号を半角にしてから、数字・小数点・マイナス以外の文字を取り除く。
+    同じ値は1回だけ変換し、数値の配列を返す。
+    """
+    codes, uniques = pd.factorize(series.astype(str))
+    text = zen_to_han(pd.Series(uniques, dtype=object)).str.replace(NON_NUMERIC_PATTERN, '', regex=True)
+    return pd.to_numeric(text, errors='coerce').to_numpy()[codes]
+
+
+def _read_numbers(text):
+    """文字列の配列を pd.to_numeric と同じ値に読む。整数だけなら int64 のまま、読めない値は NaN"""
+    try:
+        return text.astype('int64')
+    except (ValueError, OverflowError):
+        return pd.to_numeric(text, errors='coerce')
+
+
+def parse_numbers(series):
+    """
+    値を数値に変換した Series を返す。読めない値は NaN になり、型は欠損がなく整数だけなら int64、それ以外は float64。
+    数値の列や、そのまま数値として読める文字列は直接変換し、読めなかった値だけ _clean_numbers で文字を取り除いて読む。
+    指数表記や inf など、文字を取り除くと別の値になるものも _clean_numbers に回し、従来の結果と一致させる。
+    """
+    if isinstance(series.dtype, pd.SparseDtype):
+        series = series.sparse.to_dense()
+    missing = series.isna().to_numpy()
+    fast = np.zeros(len(series), dtype=bool)
+    numpy_dtype = getattr(series.dtype, 'numpy_dtype', series.dtype)
+    if pd.api.types.is_integer_dtype(series) and np.can_cast(numpy_dtype, np.int64):
+        fast = ~missing
+        fast_values = series.to_numpy()[fast].astype('int64') if missing.any() else series.to_numpy(dtype='int64')
+    elif pd.api.types.is_float_dtype(series) and numpy_dtype == np.float64:
+        # str() で指数表記になる値（1e+16 以上や 1e-04 未満）は従来どおり文字列を経由する
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        magnitude = np.abs(values)
+        fast = np.isfinite(values) & ((magnitude == 0) | ((magnitude >= 1e-4) & (magnitude < 1e16)))
+        fast_values = values[fast]
+    elif series.dtype == object:
+        values = series.to_numpy()
+        if pd.api.types.infer_dtype(series, skipna=True) == 'string':
+            fast = ~missing
+        else:
+            fast = np.fromiter((type(v) is str for v in values), bool, len(values))
+        text = values[fast]
+        try:
+            fast_values = text.astype('int64')
+        except (ValueError, OverflowError):
+            # 同じ値は1回だけ読む。読めなかった値、inf、指数表記の値は _clean_numbers に回す
+            codes, uniques = pd.factorize(text)
+            numbers = pd.to_numeric(uniques, errors='coerce')
+            readable = np.isfinite(numbers)
+            joined = ''.join(uniques[readable])
+            if 'e' in joined or 'E' in joined:
+                readable[readable] = np.fromiter(('e' not in v and 'E' not in v for v in uniques[readable]), bool, readable.sum())
+            if not readable.all():
+                numbers = _read_numbers(uniques[readable])
+                fast[np.flatnonzero(fast)[~readable[codes]]] = False
+                codes = (np.cumsum(readable) - 1)[codes[readable[codes]]]
+            fast_values = numbers[codes]
+    parts = [(fast, fast_values)] if fast.any() else []
+    slow = ~missing & ~fast
+    if slow.any():
+        parts.append((slow, _clean_numbers(series[slow])))
+    # 型は従来の pd.to_numeric と同じく、欠損があれば float64、なければ各部分の型をそろえたもの
+    has_nan = missing.any() or any(part.dtype.kind == 'f' and np.isnan(part).any() for _, part in parts)
+    dtype = np.float64 if has_nan or not parts else np.result_type(*(part.dtype for _, part in parts))
+    result = np.full(len(series), np.nan) if dtype == np.float64 else np.empty(len(series), dtype=dtype)
+    for mask, part in parts:
+        result[mask] = part
+    return pd.Series(result, index=series.index, name=series.name)
+
+
+def convert_type(df, column, new_type, exclude_first_row=False):
+    """
+    列のデータ型を変換する。変換できなかった値は元の値のまま残る。
+    数値の結果の型はデータによらず「数値 (int)」なら Int64、「数値 (float)」なら float64 にする
+    （バッチ実行でチャンクごとに型が変わらないようにするため）。
+    """
+    df_copy = df.copy()
+    series_to_modify = df_copy[column]
+    target_slice = _target_slice(series_to_modify, exclude_first_row)
+    processed_slice = None
+    if new_type in ["数値 (int)", "数値 (float)"]:
+        processed_slice = parse_numbers(target_slice)
+        processed_slice = processed_slice.astype('Int64' if new_type == "数値 (int)" else 'float64')
+    elif new_type == "文字列 (str)":
+        processed_slice = target_slice.astype(str)
+    elif new_type == "カテゴリカル (category)":
+        processed_slice = target_slice.astype('category')
+    start = len(series_to_modify) - len(target_slice)
+    df_copy[column] = _updated(series_to_modify, processed_slice, start) if processed_slice is not None else series_to_modify.copy()
+    return df_copy
+
+
+def parse_dates(target_slice, date_format):
+    """文字列のSeriesを指定された形式で日付型に変換する"""
+    if date_format == "Excelのシリアル値 (例: 45123)":
+        numeric_series = pd.to_numeric(target_slice, errors='coerce')
+        return pd.to_datetime(numeric_series, unit='D', origin='1899-12-30')
+    s_base = zen_to_han(target_slice.astype(str).dropna())
+    if date_format == "標準的な形式 (例: 2023-01-01, 2023/1/1)":
+        s = s_base.str.replace(r'\s+', '', regex=True)
+        res1 = pd.to_datetime(s, errors='coerce'); res2 = pd.to_datetime(s, format='%Y-%m', errors='coerce'); res3 = pd.to_datetime(s, format='%Y/%m', errors='coerce')
+        return res1.fillna(res2).fillna(res3)
+    if date_format == "日時形式 (YYYY-MM-DD HH:MM:SS)":
+        return pd.to_datetime(s_base, errors='coerce')
+    if date_format == "日本の形式 (例: 2023年1月1日, 令和5年1月1日)":
+        return parse_japanese_dates(s_base.str.replace(r'\s+', '', regex=True))
+    if date_format == "区切り文字なし (例: 20230101)":
+        return pd.to_datetime(s_base.str.replace(r'\s+', '', regex=True), format='%Y%m%d', errors='coerce')
+    return None
+
+
+def date_column_name(df, column):
+    """日付型に変換した列の名前（date, date_1, ...）を決める"""
+    new_col_name = "date"
+    counter = 1
+    other_columns = [c for c in df.columns if c != column]
+    while new_col_name in other_columns:
+        new_col_name = f"date_{counter}"; counter += 1
+    return new_col_name
+
+
+def convert_date(df, column, date_format, exclude_first_row=False):
+    """列を日付型に変換し、「date」列として先頭に移動する"""
+    df_copy = df.copy()
+    series_to_modify = df_copy[column]
+    converted_slice = parse_dates(_target_slice(series_to_modify, exclude_first_row), date_format)
+    final_series = _updated(series_to_modify, converted_slice) if converted_slice is not None else series_to_modify.copy()
+    new_col_name = date_column_name(df_copy, column)
+    df_copy = df_copy.drop(columns=[column])
+    df_copy.insert(0, new_col_name, final_series)
+    return df_copy
+
+
+def clean_strings(df, column, option, exclude_first_row=False):
+    """文字列のクレンジングを行う"""
+    df_copy = df.copy()
+    series_to_modify = df_copy[column]
+    col = _target_slice(series_to_modify, exclude_first_row).astype(str)
+    processed_slice = None
+    if option == "前後の空白を削除": processed_slice = col.str.strip()
+    elif option == "すべて小文字に変換": processed_slice = col.str.lower()
+    elif option == "すべて大文字に変換": processed_slice = col.str.upper()
+    elif option == "全角英数記号を半角に変換": processed_slice = zen_to_han(col)
+    df_copy[column] = _updated(series_to_modify, processed_slice) if processed_slice is not None else series_to_modify.copy()
+    return df_copy
+
+
+def cast_column(series, dtype, datetime_format=None):
+    """
+    列を指定したデータ型に変換する（データ型の自動最適化で使う）。
+    変換すると値が変わったり欠損したりする場合は ValueError を送出する。
+    """
+    def lossy():
+        return ValueError(f"列「{series.name}」を {dtype} に変換すると値が変わるため、変換できません。")
+
+    if dtype == 'category':
+        return series.astype('category')
+    if dtype in ('bool', 'boolean'):
+        converted = series.astype(str).str.strip().str.lower().map(BOOL_VALUES)
+        if (converted.isna() & series.notna()).any() or (dtype == 'bool' and series.isna().any()): raise lossy()
+        return converted.astype(dtype)
+    if dtype.startswith('datetime64'):
+        converted = pd.to_datetime(series, format=datetime_format, errors='coerce')
+        if (converted.isna() & series.notna()).any(): raise lossy()
+        return converted
+    numeric = pd.to_numeric(series, errors='coerce')
+    if (numeric.isna() & series.notna()).any(): raise lossy()
+    values = numeric.dropna().to_numpy(dtype=float)
+    if dtype.lower().startswith('int'):
+        info = np.iinfo(dtype.lower())
+        if dtype.islower() and numeric.isna().any(): raise lossy()
+        if len(values) and ((values % 1 != 0).any() or values.min() < info.min or values.max() > info.max): raise lossy()
+    elif dtype == 'float32' and (values.astype('float32').astype('float64') != values).any():
+        raise lossy()
+    return numeric.astype(dtype)
+
+
+def optimize_dtypes(df, conversions):
+    """
+    データ型の自動推定の結果を適用する。
+    conversions は {'column': 列名, 'dtype': データ型, 'format': 日付の書式} のリスト。
+    """
+    df_copy = df.copy()
+    for conversion in conversions:
+        column = conversion['column']
+        df_copy[column] = cast_column(df_copy[column], conversion['dtype'], conversion.get('format'))
+    return df_copy
+
+
+def one_hot_categories(series):
+    """
+    ワンホットエンコーディングで列になるカテゴリ（get_dummiesと同じ順序）。
+    並べ替えられない値が混在する列（数値と文字列など）は、pandas と同じく出現順になる。
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.categories.tolist()
+    return pd.Categorical(series.dropna()).categories.tolist()
+
+
+def one_hot_vocabulary(counts, order, top_n=None, min_frequency=None, other_label=OTHER_LABEL):
+    """
+    カテゴリの出現回数 counts から、ダミー列にするカテゴリ（語彙）を決める。
+    出現回数が min_frequency 未満のカテゴリと、上位 top_n 件に入らないカテゴリは other_label にまとめる。
+    """
+    if not top_n and not min_frequency:
+        return list(order)
+    counts = counts.reindex(order).fillna(0)
+    kept = counts[counts >= (min_frequency or 0)]
+    if top_n:
+        kept = kept.sort_values(ascending=False, kind='stable').iloc[:top_n]
+    vocabulary = [c for c in order if c in kept.index]
+    if len(vocabulary) < len(order):
+        vocabulary.append(other_label)
+    return vocabulary
+
+
+def fit_one_hot(df, columns, top_n=None, min_frequency=None, other_label=OTHER_LABEL):
+    """各列の語彙（列名→カテゴリのリスト）を求める"""
+    return {col: one_hot_vocabulary(df[col].value_counts(), one_hot_categories(df[col]), top_n, min_frequency, other_label) for col in columns}
+
+
+def estimate_one_hot_bytes(df, columns, categories, dtype='float64', sparse=False):
+    """ワンホットエンコーディングで追加されるダミー列のおおよそのメモリ使用量（バイト）"""
+    itemsize = np.dtype(dtype).itemsize
+    if sparse:
+        # 疎な列は0以外の値と、その位置（int32）だけを持つ
+        return int(sum(df[col].notna().sum() for col in columns) * (itemsize + 4))
+    return int(len(df) * sum(len(categories[col]) for col in columns) * itemsize)
+
+
+def one_hot_encode(df, columns, categories=None, dtype='float64', sparse=False, top_n=None, min_frequency=None, other_label=OTHER_LABEL):
+    """
+    ワンホットエンコーディングを行う。categories（列名→カテゴリのリスト）を指定すると、
+    データに含まれるカテゴリに関わらず同じ列構成で出力する。語彙に other_label が含まれる列では、
+    語彙にないカテゴリを other_label にまとめる。dtype はダミー列の型（float64 / uint8 / bool）。
+    """
+    if categories is None and (top_n or min_frequency):
+        categories = fit_one_hot(df, columns, top_n, min_frequency, other_label)
+    if categories is not None:
+        df = df.copy()
+        for col in columns:
+            # JSONに保存したレシピ・語彙では列名が文字列になっている
+            vocabulary = categories[col] if col in categories else categories[str(col)]
+            values = df[col]
+            if other_label in vocabulary:
+                values = values.astype(object).where(values.isin(vocabulary) | values.isna(), other_label)
+            df[col] = pd.Categorical(values, categories=vocabulary)
+    return pd.get_dummies(df, columns=columns, dtype=dtype, sparse=sparse)
+
+
+def make_scaler(method):
+    if method == "最小最大正規化 (Min-Max Scaling)": return MinMaxScaler()
+    return StandardScaler()
+
+
+def _row_chunks(df, columns, chunk_rows):
+    """選択した列を chunk_rows 行ずつ float64 の配列にして返す（列全体を一度に変換しない）"""
+    for start in range(0, len(df), chunk_rows):
+        yield start, df.iloc[start:start + chunk_rows][columns].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def fit_scaler(df, columns, method, scaler=None, chunk_rows=SCALE_CHUNK_ROWS):
+    """スケーラーを chunk_rows 行ずつ partial_fit で学習する。scaler を渡した場合はその続きから学習する"""
+    scaler = scaler if scaler is not None else make_scaler(method)
+    for _, values in _row_chunks(df, columns, chunk_rows):
+        scaler.partial_fit(values)
+    return scaler
+
+
+def scaler_to_dict(scaler, method, columns):
+    """学習済みのスケーラーを、JSONで保存できる辞書にする"""
+    params = {k: (v.tolist() if isinstance(v, np.ndarray) else v.item() if isinstance(v, np.generic) else v)
+              for k, v in vars(scaler).items() if k.endswith('_') and not k.startswith('_')}
+    return {'method': method, 'columns': list(columns), 'params': params}
+
+
+def scaler_from_dict(artifact):
+    """scaler_to_dict で保存した辞書からスケーラーを復元する"""
+    scaler = make_scaler(artifact['method'])
+    for k, v in artifact['params'].items():
+        setattr(scaler, k, np.asarray(v, dtype='float64') if isinstance(v, list) else v)
+    return scaler
+
+
+def scale(df, columns, method, scaler=None, dtype='float64', chunk_rows=SCALE_CHUNK_ROWS):
+    """
+    正規化・標準化を行う。学習済みの scaler（スケーラーまたは scaler_to_dict の辞書）を渡した場合は変換のみ行う。
+    変換は chunk_rows 行ずつ行い、結果は dtype（float64 / float32）の列として書き込む。他の列はコピーしない。
+    """
+    if scaler is None:
+        scaler = fit_scaler(df, columns, method, chunk_rows=chunk_rows)
+    elif isinstance(scaler, dict):
+        scaler = scaler_from_dict(scaler)
+    out = np.empty((len(df), len(columns)), dtype=dtype, order='F')
+    for start, values in _row_chunks(df, columns, chunk_rows):
+        out[start:start + len(values)] = scaler.transform(values)
+    if not df.columns.is_unique:
+        df_copy = df.copy()
+        df_copy[columns] = out
+        return df_copy
+    scaled = dict(zip(columns, out.T))
+    return pd.DataFrame({col: scaled[col] if col in scaled else df[col] for col in df.columns}, index=df.index, copy=False)
+
+
+COLUMN_OPERATIONS = {
+    'fill_missing': fill_missing,
+    'convert_type': convert_type,
+    'convert_date': convert_date,
+    'clean_strings': clean_strings,
+}
+
+
+def _is_text(series):
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'string'
+
+
+def _lossy_as_float(series, floats):
+    """float64 に変換すると値が丸められる整数のマスク（丸められた値は、元の整数と等しい浮動小数点数がない）"""
+    ints = series.to_numpy(dtype='uint64' if series.dtype.kind == 'u' else 'int64', na_value=0)
+    in_range = np.abs(floats) < 2.0 ** (64 if series.dtype.kind == 'u' else 63)
+    lossy = ~in_range
+    lossy[in_range] = floats[in_range].astype(ints.dtype) != ints[in_range]
+    return lossy
+
+
+def _changed_mask(before, after):
+    """
+    値が変わった要素（欠損の有無が変わった要素を含む）のマスク。
+    同じ型の列や数値の列同士は型のまま比べ、文字列と数値・日付のように必ず異なる組み合わせは比較を省く。
+    """
+    before_missing, after_missing = before.isna().to_numpy(), after.isna().to_numpy()
+    changed = before_missing != after_missing
+    both = ~before_missing & ~after_missing
+    kinds = {s.dtype.kind if not isinstance(s.dtype, pd.CategoricalDtype) else 'c' for s in (before, after)}
+    if kinds <= {'i', 'b'} or kinds <= {'u', 'b'}:
+        dtype = 'uint64' if 'u' in kinds else 'int64'
+        a, b = (s.to_numpy(dtype=dtype, na_value=0) for s in (after, before))
+    elif kinds <= {'i', 'b', 'f'} or kinds <= {'u', 'b', 'f'}:
+        a, b = (s.to_numpy(dtype='float64', na_value=np.nan) for s in (after, before))
+        changed[both] = a[both] != b[both]
+        for s, floats in ((after, a), (before, b)):
+            if s.dtype.kind in 'iu':
+                changed |= both & _lossy_as_float(s, floats)
+        return changed
+    elif before.dtype == after.dtype and kinds != {'c'}:
+        a, b = after.to_numpy(), before.to_numpy()
+    elif (kinds & {'i', 'u', 'b', 'f', 'M', 'm'}) and (_is_text(before) or _is_text(after)):
+        # 文字列と数値・日付は等しくならない
+        changed[both] = True
+        return changed
+    else:
+        a, b = after.astype(object).to_numpy(), before.astype(object).to_numpy()
+    changed[both] = a[both] != b[both]
+    return changed
+
+
+def _unconverted_count(op, params, after, changed):
+    """
+    変換できずに元の値のまま残った値（欠損値処理の場合は残った欠損値）の数。
+    元の値のまま残るのは変わっていない要素だけなので、その中で数値・日付でない値を数える。
+    """
+    if op == 'fill_missing':
+        return int(after.isna().sum())
+    if after.dtype != object:
+        return 0
+    if op == 'convert_type' and params['new_type'] in ["数値 (int)", "数値 (float)"]:
+        expected = numbers.Number
+    elif op == 'convert_date':
+        expected = pd.Timestamp
+    else:
+        return 0
+    kept = after.to_numpy()[~changed & after.notna().to_numpy()]
+    return sum(not isinstance(v, expected) for v in kept)
+
+
+def _apply_single_column(op, column, params, frame):
+    """1列だけのデータフレームに列ごとの操作を適用する（並列実行の単位）。(結果, 変更した値の数, 未変換の値の数, エラー) を返す"""
+    try:
+        result = COLUMN_OPERATIONS[op](frame, column=column, **params)
+    except Exception as e:
+        return None, 0, 0, e
+    if len(result) < len(frame):
+        return result, 0, 0, None
+    after = result.iloc[:, 0]
+    changed = _changed_mask(frame[column], after)
+    return result, int(changed.sum()), _unconverted_count(op, params, after, changed), None
+
+
+def batch_apply(df, op, columns, params, max_workers=None, processes=None):
+    """
+    同じ列ごとの操作を複数の列に適用する。列は互いに独立なので、スレッド（processes=True ならプロセス）で並列に処理する。
+    processes=None の場合、CPUが複数あり処理するセルが多いときだけプロセスを使う。
+    失敗した列は元のまま残し、(新しいデータフレーム, 列ごとの結果の表) を返す。
+    """
+    if processes is None:
+        processes = (os.cpu_count() or 1) > 1 and len(df) * len(columns) >= PROCESS_MIN_CELLS
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        futures = [executor.submit(_apply_single_column, op, col, params, df[[col]]) for col in columns]
+        results = [future.result() for future in futures]
+
+    df_copy = df.copy()
+    dropped = pd.Index([])
+    rows = []
+    for col, (frame, changed, unconverted, error) in zip(columns, results):
+        if error is not None:
+            rows.append([str(col), "失敗", 0, 0, 0, str(error)]); continue
+        removed = len(df) - len(frame)
+        if removed:
+            dropped = dropped.union(df.index.difference(frame.index))
+        elif op == 'convert_date':
+            # 1列ずつ順に変換した場合と同じく、date, date_1, ... の名前で先頭に挿入する
+            new_col_name = date_column_name(df_copy, col)
+            df_copy = df_copy.drop(columns=[col])
+            df_copy.insert(0, new_col_name, frame.iloc[:, 0])
+        else:
+            df_copy[col] = frame[col]
+        rows.append([str(col), "成功", changed, unconverted, removed, ""])
+    if len(dropped):
+        df_copy = df_copy.drop(dropped)
+    summary = pd.DataFrame(rows, columns=["列", "結果", "変更した値", "未変換の値", "削除した行", "エラー"])
+    return df_copy, summary
+
+
+def apply_to_columns(df, operation, columns, params):
+    """複数の列への一括処理（レシピから呼び出す場合）"""
+    return batch_apply(df, operation, columns, params)[0]
+
+
+def column_arithmetic(df, operation, columns, new_col_name):
+    """数値列の四則演算の結果を新しい列として追加する"""
+    temp_df = df.copy()
+    if operation == '列の合計': temp_df[new_col_name] = temp_df[columns].sum(axis=1)
+    elif operation == '列の積': temp_df[new_col_name] = temp_df[columns].prod(axis=1)
+    elif operation == '列の差': temp_df[new_col_name] = _widened(temp_df[columns[0]]) - _widened(temp_df[columns[1]])
+    elif operation == '列の商':
+        if (temp_df[columns[1]] == 0).any(): raise ValueError("割る数に0が含まれています。")
+        temp_df[new_col_name] = _widened(temp_df[columns[0]]) / _widened(temp_df[columns[1]])
+    return temp_df
@@ -7,23 +7,104 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import io
+import json
 import plotly.express as px
-import mojimoji
-from sklearn.preprocessing import MinMaxScaler, StandardScaler
 import sys
 
+from csv_loader import load_csv
+from data_stats import SAMPLE_SIZE, DataStats, dense_columns
+from dtype_inference import infer_dtypes
+from exporters import ARROW_AVAILABLE, EXPORT_FORMATS, FEATHER_COMPRESSIONS, PARQUET_COMPRESSIONS, export_bytes
+from history import DataHistory
+from operations import (ARITHMETIC_OPERATIONS, CLEAN_OPTIONS, DATE_FORMATS, DUMMY_DTYPES, FILL_METHODS, ONE_HOT_DENSE_WARN_BYTES, OTHER_LABEL, SCALE_DTYPES,
+                        SCALING_METHODS, TYPE_OPTIONS, batch_apply, estimate_one_hot_bytes, fit_one_hot, fit_scaler, scaler_from_dict, scaler_to_dict)
+from profiling import DETAIL_MODES, Profiler
+from recipes import YAML_AVAILABLE, apply_step, decode_timestamps, dump_recipe, encode_timestamps, load_recipe, make_step
+
 # --- Streamlitアプリの基本設定 ---
 st.set_page_config(page_title="データ前処理サポーター", page_icon="🛠️", layout="wide")
 
 # --- Session Stateの初期化 ---
 if 'df' not in st.session_state: st.session_state.df = None
-if 'original_df' not in st.session_state: st.session_state.original_df = None
+if 'history' not in st.session_state: st.session_state.history = DataHistory()
+if 'stats' not in st.session_state: st.session_state.stats = DataStats()
+if 'scalers' not in st.session_state: st.session_state.scalers = {}
+if 'profiler' not in st.session_state: st.session_state.profiler = Profiler()
 if 'uploaded_file_name' not in st.session_state: st.session_state.uploaded_file_name = None
 if 'target_col' not in st.session_state: st.session_state.target_col = None
 if 'feature_cols' not in st.session_state: st.session_state.feature_cols = None
 
+def set_current_df(new_df, columns=None):
+    """現在のデータを差し替え、統計量キャッシュに変更された列を伝える"""
+    st.session_state.stats.update(st.session_state.df, new_df, columns)
+    st.session_state.df = new_df
+    # データ型の推定パネルは、データが変わったら閉じる（開いたままだと変更のたびに推定し直すため）
+    st.session_state.infer_dtypes = False
+
+def infer_dtypes_with_usage(df):
+    """データ型の推定結果と、変換前のデータ全体のメモリ使用量 (MB) を求める（frame_stat でキャッシュする）"""
+    with st.session_state.profiler.section("infer_dtypes", "操作", df):
+        conversions, report = infer_dtypes(df)
+        total_before = df.memory_usage(deep=True).sum() / 1024 ** 2
+    return conversions, report, total_before
+
+def run_step(df, step):
+    """レシピのステップを実行し、実行時間とメモリをプロファイルに記録する"""
+    with st.session_state.profiler.section(step['op'], "操作", df) as record:
+        record.output = apply_step(df, step)
+    return record.output
+
+def commit_df(new_df, label, columns=None, recipe_step=None):
+    """操作結果を現在のデータに反映し、変更履歴とレシピに記録する（columns: 値が変わった既存列）"""
+    st.session_state.history.push(st.session_state.df, new_df, label, columns, recipe_step)
+    set_current_df(new_df, columns)
+
 # --- 各UIセクションの関数化 ---
-# (display_sidebar, display_health_check, display_global_cleaning 関数は変更なし)
+def display_history_controls():
+    """サイドバーに「元に戻す／やり直す」と履歴のメモリ使用量を表示する"""
+    history = st.session_state.history
+    col_undo, col_redo = st.columns(2)
+    if col_undo.button("↩️ 元に戻す", disabled=not history.can_undo, use_container_width=True):
+        label = history.undo_labels[-1]
+        set_current_df(history.undo(st.session_state.df), history.last_columns)
+        st.info(f"「{label}」を取り消しました。"); st.rerun()
+    if col_redo.button("↪️ やり直す", disabled=not history.can_redo, use_container_width=True):
+        label = history.redo_labels[-1]
+        set_current_df(history.redo(st.session_state.df), history.last_columns)
+        st.info(f"「{label}」をやり直しました。"); st.rerun()
+    with st.expander("操作履歴"):
+        if history.undo_labels:
+            st.write("\n".join(f"{i + 1}. {label}" for i, label in enumerate(history.undo_labels)))
+        else:
+            st.caption("まだ操作はありません。")
+        if history.evicted:
+            st.caption(f"メモリ上限のため、古い操作 {history.evicted} 件の履歴を削除しました。")
+        budget_mb = st.number_input("履歴に使うメモリの上限 (MB)", min_value=16, value=history.max_bytes // 1024 ** 2, step=64)
+        history.max_bytes = int(budget_mb) * 1024 ** 2
+        st.progress(min(history.nbytes / history.max_bytes, 1.0), text=f"履歴のメモリ使用量: {history.nbytes / 1024 ** 2:.1f} MB / {budget_mb} MB")
+
+def display_recipe_controls():
+    """サイドバーに、これまでの操作をレシピとして保存・読み込みするUIを表示する"""
+    with st.expander("🧾 レシピ（操作の記録）"):
+        recipe = st.session_state.history.recipe
+        st.caption(f"記録済みの操作: {len(recipe)} 件。保存したレシピは別のファイルに適用したり、`batch_runner.py` で大きなCSVに一括適用したりできます。")
+        if recipe:
+            st.download_button("レシピをJSONで保存", data=dump_recipe(recipe), file_name='recipe.json', mime='application/json')
+            if YAML_AVAILABLE:
+                st.download_button("レシピをYAMLで保存", data=dump_recipe(recipe, fmt='yaml'), file_name='recipe.yaml', mime='application/x-yaml')
+        recipe_file = st.file_uploader("レシピを読み込む", type=['json', 'yaml', 'yml'], key="recipe_file")
+        if recipe_file is not None and st.button("レシピを適用"):
+            try:
+                steps = load_recipe(recipe_file.getvalue().decode('utf-8'))
+            except Exception as e:
+                st.error(f"レシピを読み込めませんでした: {e}"); return
+            for i, step in enumerate(steps):
+                try:
+                    commit_df(run_step(st.session_state.df, step), f"レシピ: {step['op']}", recipe_step=step)
+                except Exception as e:
+                    st.error(f"{i + 1}件目の操作（{step['op']}）でエラーが発生しました。それより前の操作は適用済みです: {e}"); return
+            st.success(f"レシピの {len(steps)} 件の操作を適用しました。"); st.rerun()
+
 def display_sidebar():
     """サイドバーのUIを表示し、ファイルアップロードや基本操作を処理する"""
     with st.sidebar:
@@ -33,24 +114,29 @@ def display_sidebar():
         if uploaded_file is not None:
             if st.session_state.uploaded_file_name != uploaded_file.name:
                 df = None
+                progress_bar = st.sidebar.progress(0.0, text="ファイルを読み込み中...")
                 try:
-                    df = pd.read_csv(uploaded_file, header=None, engine='python', on_bad_lines='skip')
-                except UnicodeDecodeError:
-                    try:
-                        st.sidebar.warning("UTF-8での読み込みに失敗。Shift-JISで再試行します。")
-                        uploaded_file.seek(0)
-                        df = pd.read_csv(uploaded_file, header=None, encoding='cp932', engine='python', on_bad_lines='skip')
-                    except Exception as e:
-                        st.error(f"Shift-JISでも読み込みに失敗しました: {e}")
+                    with st.session_state.profiler.section("load_csv", "読み込み") as record:
+                        result = load_csv(uploaded_file, progress_callback=lambda p: progress_bar.progress(p, text="ファイルを読み込み中..."))
+                        record.output = result.df
+                    df = result.df
+                    if result.encoding == 'cp932': st.sidebar.info("Shift-JIS (cp932) として読み込みました。")
+                    if result.engine == 'python': st.sidebar.warning("高速パーサーで解析できない箇所があったため、その部分をPythonエンジンで読み込みました。")
+                    if result.bad_lines > 0: st.sidebar.warning(f"列数が一致しない {result.bad_lines} 行をスキップしました。")
+                except UnicodeDecodeError as e:
+                    st.error(f"UTF-8・Shift-JISのどちらでも読み込みに失敗しました: {e}")
                 except Exception as e:
                     st.error(f"ファイルの読み込み中に予期せぬエラーが発生しました: {e}")
+                finally:
+                    progress_bar.empty()
 
                 if df is not None:
                     st.session_state.uploaded_file_name = uploaded_file.name
-                    st.session_state.df = df
-                    st.session_state.original_df = df.copy()
+                    st.session_state.history.clear()
+                    set_current_df(df)
                     st.session_state.target_col = None
                     st.session_state.feature_cols = None
+                    st.session_state.pop('batch_summary', None)
                     st.sidebar.success("ファイルが正常に読み込まれました！")
                 else:
                     st.session_state.df = None
@@ -60,7 +146,7 @@ def display_sidebar():
             with st.expander('列の四則演算'):
                 df_sidebar = st.session_state.df
                 numeric_cols_sidebar = [c for c in df_sidebar.columns if pd.api.types.is_numeric_dtype(df_sidebar[c])]
-                operation = st.selectbox('実行したい操作を選択', ['---', '列の合計', '列の積', '列の差', '列の商'])
+                operation = st.selectbox('実行したい操作を選択', ['---'] + ARITHMETIC_OPERATIONS)
                 if operation != '---':
                     if operation in ['列の差', '列の商']:
                         cols_to_operate = st.multiselect(f'「{operation}」を計算する数値列を2つ選択', numeric_cols_sidebar, max_selections=2)
@@ -70,51 +156,84 @@ def display_sidebar():
                     if st.button(f'{operation}を実行'):
                         if len(cols_to_operate) >= 2 and new_col_name:
                             try:
-                                temp_df = st.session_state.df.copy()
-                                if operation == '列の合計': temp_df[new_col_name] = temp_df[cols_to_operate].sum(axis=1)
-                                elif operation == '列の積': temp_df[new_col_name] = temp_df[cols_to_operate].prod(axis=1)
-                                elif operation == '列の差': temp_df[new_col_name] = temp_df[cols_to_operate[0]] - temp_df[cols_to_operate[1]]
-                                elif operation == '列の商':
-                                    if (temp_df[cols_to_operate[1]] == 0).any(): st.error("エラー: 割る数に0が含まれています。")
-                                    else: temp_df[new_col_name] = temp_df[cols_to_operate[0]] / temp_df[cols_to_operate[1]]
-                                st.session_state.df = temp_df
+                                step = make_step('column_arithmetic', operation=operation, columns=cols_to_operate, new_col_name=new_col_name)
+                                commit_df(run_step(st.session_state.df, step), operation, [new_col_name], step)
                                 st.success(f"新しい列 '{new_col_name}' を作成しました。"); st.rerun()
+                            except ValueError as e: st.error(f"エラー: {e}")
                             except Exception as e: st.error(f"計算中にエラーが発生しました: {e}")
                         else: st.warning("列と新しい列名を確認してください。")
 
+            display_history_controls()
+            display_recipe_controls()
             if st.button("最初の状態に戻す"):
-                st.session_state.df = st.session_state.original_df.copy()
+                set_current_df(st.session_state.history.undo_all(st.session_state.df))
                 st.session_state.target_col = None
                 st.session_state.feature_cols = None
-                st.info("データが最初の状態にリセットされました。"); st.rerun()
+                if st.session_state.history.evicted:
+                    st.warning("メモリ上限のため古い履歴が削除されており、保持している最も古い状態までしか戻せませんでした。")
+                else:
+                    st.info("データが最初の状態にリセットされました。")
+                st.rerun()
 
         st.sidebar.subheader("🧪 環境情報")
         st.sidebar.write(f"Pandas Version: **{pd.__version__}**")
         st.sidebar.write(f"Python Version: {sys.version.split(' ')[0]}")
+
+def display_profiler_panel():
+    """「⏱️ プロファイル」パネル（環境情報の下）を表示する"""
+    profiler = st.session_state.profiler
+    st.sidebar.subheader("⏱️ プロファイル")
+    with st.sidebar.expander("操作・描画ごとの処理時間とメモリ"):
+        detail = st.radio("詳細プロファイル（最も遅い操作を記録）", ["しない"] + DETAIL_MODES, key="profile_detail", help="有効にすると操作が少し遅くなります。")
+        profiler.detail = None if detail == "しない" else detail
+        log = profiler.to_frame()
+        if log.empty: st.caption("まだ記録はありません。")
+        else:
+            st.dataframe(log.iloc[::-1].head(50), hide_index=True)
+            st.download_button("ログをJSONで保存", data=profiler.to_json(), file_name="profile_log.json", mime="application/json")
+        if profiler.slowest:
+            st.write(f"最も遅い操作: **{profiler.slowest['name']}** ({profiler.slowest['seconds']:.2f} 秒, {profiler.slowest['mode']})")
+            st.code(profiler.slowest['report'])
+        if st.button("ログを消去"): profiler.clear(); st.rerun()
 def display_health_check(df):
     """「データの健康診断」セクションを表示する"""
     st.header("🩺 データの健康診断")
+    stats = st.session_state.stats
     tab1, tab2, tab3, tab4 = st.tabs(["基本情報", "欠損値", "統計量", "グラフで可視化"])
     with tab1:
         st.subheader("基本情報"); st.markdown(f"**行数:** {df.shape[0]} 行, **列数:** {df.shape[1]} 列")
         st.subheader("データプレビュー（先頭20行）")
-        st.dataframe(df.head(20))
+        st.dataframe(dense_columns(df.head(20)))
     with tab2:
-        st.subheader("各列の欠損値の数"); missing_values = df.isnull().sum(); st.dataframe(missing_values[missing_values > 0].sort_values(ascending=False).rename("欠損数"))
+        st.subheader("各列の欠損値の数"); missing_values = stats.missing_counts(df); st.dataframe(missing_values[missing_values > 0].sort_values(ascending=False).rename("欠損数"))
     with tab3:
-        st.subheader("各列の統計量"); st.dataframe(df.describe(include='all'))
+        st.subheader("各列の統計量"); st.dataframe(stats.describe(df))
     with tab4:
         st.subheader("列の分布をグラフで確認")
         graph_col = st.selectbox("グラフを表示する列を選択", df.columns, key="graph_col")
         if graph_col is not None:
-            plot_series = df[graph_col].dropna()
-            if pd.api.types.is_numeric_dtype(plot_series) and not plot_series.empty:
+            has_values = stats.missing_count(df, graph_col) < len(df)
+            if pd.api.types.is_numeric_dtype(df[graph_col]) and has_values:
                 st.write(f"**{graph_col}** のヒストグラム")
-                fig = px.histogram(df, x=graph_col, title=f'「{graph_col}」の分布')
+                counts, edges = stats.histogram(df, graph_col)
+                hist_df = pd.DataFrame({str(graph_col): (edges[:-1] + edges[1:]) / 2, 'カウント': counts})
+                fig = px.bar(hist_df, x=str(graph_col), y='カウント', title=f'「{graph_col}」の分布')
+                fig.update_traces(width=np.diff(edges)); fig.update_layout(bargap=0)
                 st.plotly_chart(fig, use_container_width=True)
-            elif not plot_series.empty:
+                if st.checkbox("サンプリングした散布図・箱ひげ図を表示する", key="show_sample_plots"):
+                    sample_size = st.number_input("サンプル数", min_value=min(100, len(df)), max_value=max(len(df), 100), value=min(len(df), SAMPLE_SIZE), step=100, key="sample_size")
+                    sample_df = stats.sample(df, int(sample_size))
+                    st.caption(f"全 {len(df)} 行から {len(sample_df)} 行を無作為に抽出して表示しています。")
+                    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+                    x_col = st.selectbox("散布図の横軸", ["（行番号）"] + [c for c in numeric_cols if c != graph_col], key="scatter_x")
+                    x = sample_df.index if x_col == "（行番号）" else x_col
+                    fig = px.scatter(sample_df, x=x, y=graph_col, labels={'x': "行番号"}, title=f'「{graph_col}」の散布図（サンプル）')
+                    st.plotly_chart(fig, use_container_width=True)
+                    fig = px.box(sample_df, y=graph_col, title=f'「{graph_col}」の箱ひげ図（サンプル）')
+                    st.plotly_chart(fig, use_container_width=True)
+            elif has_values:
                 st.write(f"**{graph_col}** の度数分布（上位20件）")
-                value_counts = plot_series.value_counts().nlargest(20)
+                value_counts = stats.value_counts(df, graph_col, 20)
                 value_counts_df = value_counts.reset_index()
                 value_counts_df.columns = [str(graph_col), 'カウント']
                 fig = px.bar(value_counts_df, x=str(graph_col), y='カウント', title=f'「{graph_col}」のTOP20カテゴリ')
@@ -132,42 +251,68 @@ def display_global_cleaning(df):
     )
 
     if st.button("指定行をヘッダーとして設定し、それより上を削除"):
-        if header_row >= len(df):
-            st.error(f"エラー: 指定された行番号 {header_row} はデータの範囲外です。このデータは {len(df)} 行（0から{len(df)-1}まで）しかありません。")
+        try:
+            step = make_step('set_header', row=header_row)
+            commit_df(run_step(df, step), "ヘッダー行の設定", recipe_step=step)
+            st.session_state.infer_dtypes = True
+            st.success(f"{header_row}行目を新しいヘッダーに設定し、データフレームを更新しました。")
+            st.rerun()
+        except ValueError as e:
+            st.error(f"エラー: {e}")
+        except Exception as e:
+            st.error(f"処理中にエラーが発生しました: {e}")
+    st.markdown("---")
+
+    st.subheader("データ型の自動推定とメモリ最適化")
+    st.write("各列の値から整数・小数・日付・真偽値・カテゴリを推定し、できるだけ小さいデータ型に変換します。ヘッダー行を設定すると自動で推定します。")
+    if not st.session_state.get('infer_dtypes') and st.button("データ型を推定する"):
+        st.session_state.infer_dtypes = True
+    if st.session_state.get('infer_dtypes'):
+        with st.spinner("データ型を推定しています..."):
+            conversions, report, total_before = st.session_state.stats.frame_stat(df, 'dtype_inference', infer_dtypes_with_usage)
+        if not conversions:
+            st.info("変換を提案できる列はありません。")
         else:
+            total_after = total_before - report["変換前 (MB)"].sum() + report["変換後 (MB)"].sum()
+            st.dataframe(report.style.format({"変換前 (MB)": "{:.3f}", "変換後 (MB)": "{:.3f}"}))
+            st.write(f"データ全体のメモリ使用量: **{total_before:.2f} MB → {total_after:.2f} MB**")
+        col1, col2 = st.columns(2)
+        if conversions and col1.button("推定したデータ型を適用する", type="primary"):
+            step = make_step('optimize_dtypes', conversions=conversions)
             try:
-                df_copy = df.copy()
-                potential_header = df_copy.iloc[header_row].astype(str).fillna('untitled')
-                
-                if potential_header.duplicated().any():
-                    duplicates = potential_header[potential_header.duplicated()].unique().tolist()
-                    st.error(f"エラー: {header_row}行目には重複した値が含まれているため、ヘッダーとして設定できません。")
-                    st.write("重複している値:", duplicates)
-                else:
-                    df_copy = df_copy.iloc[header_row + 1:]
-                    df_copy.columns = potential_header
-                    df_copy.reset_index(drop=True, inplace=True)
-                    st.session_state.df = df_copy
-                    st.success(f"{header_row}行目を新しいヘッダーに設定し、データフレームを更新しました。")
-                    st.rerun()
-            except Exception as e:
-                st.error(f"処理中にエラーが発生しました: {e}")
+                commit_df(run_step(df, step), "データ型の自動最適化", [c['column'] for c in conversions], step)
+                st.success("データ型を変換しました。"); st.rerun()
+            except ValueError as e: st.error(f"エラー: {e}")
+        if col2.button("閉じる", key="close_dtype_inference"):
+            st.session_state.infer_dtypes = False; st.rerun()
     st.markdown("---")
 
     st.subheader("列の一括削除")
     columns_to_drop = st.multiselect('不要な列を複数選択できます。', df.columns)
     if st.button("選択した列を削除する"):
         if columns_to_drop:
-            st.session_state.df = df.drop(columns=columns_to_drop)
+            step = make_step('drop_columns', columns=columns_to_drop)
+            commit_df(run_step(df, step), "列の一括削除", [], step)
             st.success("選択された列を削除しました。"); st.rerun()
         else: st.warning("削除する列が選択されていません。")
 
-    num_duplicates = df.duplicated().sum()
+    st.subheader("重複行の削除")
+    stats = st.session_state.stats
+    key_columns = st.multiselect("重複を判定するキー列（未選択の場合はすべての列）", df.columns, key="duplicate_keys")
+    num_duplicates = stats.duplicate_count(df, key_columns)
+    target_text = "選択したキー列の値が一致する" if key_columns else "データセット全体に"
     if num_duplicates > 0:
-        st.subheader("重複行の削除")
-        st.write(f"データセット全体に **{num_duplicates}** 件の重複行があります。")
+        st.write(f"{target_text} **{num_duplicates}** 件の重複行があります。")
+        with st.expander("重複している行のサンプル（先頭5グループ）"):
+            st.dataframe(dense_columns(stats.duplicate_groups(df, key_columns)))
+        keep_label = st.radio("残す行", ["最初に出現した行を残す", "最後に出現した行を残す"], horizontal=True, key="duplicate_keep")
         if st.button("重複行をすべて削除する"):
-            st.session_state.df = df.drop_duplicates(); st.success("重複行を削除しました。"); st.rerun()
+            keep = 'first' if keep_label == "最初に出現した行を残す" else 'last'
+            step = make_step('drop_duplicates', subset=key_columns or None, keep=keep)
+            with st.session_state.profiler.section("drop_duplicates", "操作", df) as record:
+                record.output = df[~stats.duplicated(df, key_columns, keep).to_numpy()]
+            commit_df(record.output, "重複行の削除", [], step); st.success("重複行を削除しました。"); st.rerun()
+    else: st.write("重複行はありません。")
 
 def display_column_wise_cleaning(df):
     st.header("💊 列ごとの対話型クリーニング")
@@ -180,13 +325,12 @@ def display_column_wise_cleaning(df):
     st.markdown("---")
 
     col_type = df[selected_column].dtype
-    missing_count = df[selected_column].isnull().sum()
+    missing_count = st.session_state.stats.missing_count(df, selected_column)
     st.write(f"選択中の列: **{selected_column}** (データ型: {col_type}, 欠損値: {missing_count}個)")
     st.subheader(f"「{selected_column}」列へのアクション")
 
     if missing_count > 0:
         with st.expander("欠損値の処理"):
-            # (欠損値処理のロジックは変更なし)
             options = ["最頻値で埋める", "指定した値で埋める", "行ごと削除する"]
             if pd.api.types.is_numeric_dtype(df[selected_column]):
                 options = ["平均値で埋める", "中央値で埋める"] + options
@@ -194,21 +338,8 @@ def display_column_wise_cleaning(df):
             fill_value = None
             if fill_method == "指定した値で埋める": fill_value = st.text_input("埋める値を入力してください")
             if st.button("欠損値処理を実行", key=f"btn_fill_{selected_column}"):
-                df_copy = df.copy()
-                series_to_modify = df_copy[selected_column]
-                series_to_process = series_to_modify.iloc[1:] if exclude_first_row and len(series_to_modify) > 0 else series_to_modify
-
-                if fill_method == "平均値で埋める": series_to_process.fillna(series_to_process.mean(numeric_only=True), inplace=True)
-                elif fill_method == "中央値で埋める": series_to_process.fillna(series_to_process.median(numeric_only=True), inplace=True)
-                elif fill_method == "最頻値で埋める": series_to_process.fillna(series_to_process.mode()[0], inplace=True)
-                elif fill_method == "指定した値で埋める" and fill_value: series_to_process.fillna(fill_value, inplace=True)
-                
-                series_to_modify.update(series_to_process)
-                if fill_method == "行ごと削除する":
-                    indices_to_drop = series_to_process[series_to_process.isnull()].index
-                    df_copy.drop(indices_to_drop, inplace=True)
-
-                st.session_state.df = df_copy
+                step = make_step('fill_missing', column=selected_column, method=fill_method, value=fill_value, exclude_first_row=exclude_first_row)
+                commit_df(run_step(df, step), f"欠損値処理: {selected_column}", [selected_column], step)
                 st.success(f"「{selected_column}」列の欠損値処理が完了しました。"); st.rerun()
     
     # --- ▼▼▼ ここから修正 ▼▼▼ ---
@@ -216,33 +347,19 @@ def display_column_wise_cleaning(df):
         # 選択肢に「カテゴリカル(category)」を追加
         new_type = st.selectbox(
             "変換したいデータ型を選択",
-            ["---", "数値 (int)", "数値 (float)", "文字列 (str)", "カテゴリカル (category)"],
+            ["---"] + TYPE_OPTIONS,
             key=f"type_{selected_column}"
         )
         if st.button("データ型を変換", key=f"btn_type_{selected_column}"):
             if new_type != "---":
                 try:
-                    df_copy = df.copy()
-                    series_to_modify = df_copy[selected_column]
+                    series_to_modify = df[selected_column]
                     target_slice = series_to_modify.iloc[1:] if exclude_first_row and len(series_to_modify) > 0 else series_to_modify
                     pre_missing = target_slice.isnull().sum()
-                    processed_slice = None
-
-                    if new_type in ["数値 (int)", "数値 (float)"]:
-                        processed_slice = pd.to_numeric(target_slice.astype(str).str.replace(r'[^\d.-]', '', regex=True), errors='coerce')
-                        if new_type == "数値 (int)": processed_slice = processed_slice.astype('Int64')
-                    elif new_type == "文字列 (str)":
-                        processed_slice = target_slice.astype(str)
-                    # カテゴリカル型への変換ロジックを追加
-                    elif new_type == "カテゴリカル (category)":
-                        processed_slice = target_slice.astype('category')
-                    
-                    final_series = series_to_modify.copy()
-                    final_series.update(processed_slice)
-                    df_copy[selected_column] = final_series
-                    
-                    post_missing = final_series.isnull().sum()
-                    st.session_state.df = df_copy
+                    step = make_step('convert_type', column=selected_column, new_type=new_type, exclude_first_row=exclude_first_row)
+                    df_copy = run_step(df, step)
+                    post_missing = df_copy[selected_column].isnull().sum()
+                    commit_df(df_copy, f"型変換: {selected_column}", [selected_column], step)
                     st.success(f"「{selected_column}」列を{new_type}型に変換しました。")
                     if post_missing > pre_missing: st.warning(f"{post_missing - pre_missing}個のデータが変換に失敗し、欠損値になりました。")
                     st.rerun()
@@ -250,66 +367,18 @@ def display_column_wise_cleaning(df):
     # --- ▲▲▲ ここまで修正 ▲▲▲ ---
 
     with st.expander("日付型への変換"):
-        # (日付型変換のロジックは変更なし)
-        date_format_option = st.radio("データの形式を選択", ("標準的な形式 (例: 2023-01-01, 2023/1/1)", "日時形式 (YYYY-MM-DD HH:MM:SS)", "日本の形式 (例: 2023年1月1日, 令和5年1月1日)", "区切り文字なし (例: 20230101)", "Excelのシリアル値 (例: 45123)"), key=f"date_{selected_column}")
+        date_format_option = st.radio("データの形式を選択", DATE_FORMATS, key=f"date_{selected_column}")
         if st.button("日付型に変換を実行", key=f"btn_date_{selected_column}"):
             try:
-                df_copy = df.copy()
                 col_name = selected_column
-                series_to_modify = df_copy[col_name]
+                series_to_modify = df[col_name]
                 target_slice = series_to_modify.iloc[1:] if exclude_first_row and len(series_to_modify) > 0 else series_to_modify
                 pre_missing = target_slice.isnull().sum()
-                converted_slice = None
-                if date_format_option == "Excelのシリアル値 (例: 45123)":
-                    numeric_series = pd.to_numeric(target_slice, errors='coerce')
-                    converted_slice = pd.to_datetime(numeric_series, unit='D', origin='1899-12-30')
-                else:
-                    s_base = target_slice.astype(str).dropna().apply(lambda x: mojimoji.zen_to_han(x, kana=False))
-                    if date_format_option == "標準的な形式 (例: 2023-01-01, 2023/1/1)":
-                        s = s_base.str.replace(r'\s+', '', regex=True)
-                        res1 = pd.to_datetime(s, errors='coerce'); res2 = pd.to_datetime(s, format='%Y-%m', errors='coerce'); res3 = pd.to_datetime(s, format='%Y/%m', errors='coerce')
-                        converted_slice = res1.fillna(res2).fillna(res3)
-                    elif date_format_option == "日時形式 (YYYY-MM-DD HH:MM:SS)":
-                        converted_slice = pd.to_datetime(s_base, errors='coerce')
-                    elif date_format_option == "日本の形式 (例: 2023年1月1日, 令和5年1月1日)":
-                        s = s_base.str.replace(r'\s+', '', regex=True)
-                        def convert_japanese_date(jp_date_text):
-                            if not isinstance(jp_date_text, str): return None
-                            text = jp_date_text.replace('元年', '1年')
-                            try: return pd.to_datetime(text, format='%Y年%m月%d日')
-                            except ValueError:
-                                try: return pd.to_datetime(text, format='%Y年%m月')
-                                except ValueError:
-                                    try: return pd.to_datetime(text, format='%Y年')
-                                    except ValueError:
-                                        year_str = text.split('年')[0]; year = 0
-                                        if '令和' in year_str: year = int(year_str.replace('令和', '')) + 2018
-                                        elif '平成' in year_str: year = int(year_str.replace('平成', '')) + 1988
-                                        elif '昭和' in year_str: year = int(year_str.replace('昭和', '')) + 1925
-                                        elif '大正' in year_str: year = int(year_str.replace('大正', '')) + 1911
-                                        elif '明治' in year_str: year = int(year_str.replace('明治', '')) + 1867
-                                        if year == 0: return None
-                                        try:
-                                            month_day_part = text.split('年')[1]
-                                            if '日' in month_day_part: month, day = int(month_day_part.split('月')[0]), int(month_day_part.split('月')[1].replace('日', ''))
-                                            else: month, day = int(month_day_part.replace('月', '')), 1
-                                            return pd.to_datetime(f'{year}-{month}-{day}')
-                                        except (IndexError, ValueError): return pd.to_datetime(f'{year}-01-01')
-                        converted_slice = s.apply(convert_japanese_date)
-                    elif date_format_option == "区切り文字なし (例: 20230101)":
-                        s = s_base.str.replace(r'\s+', '', regex=True)
-                        converted_slice = pd.to_datetime(s, format='%Y%m%d', errors='coerce')
-                final_series = series_to_modify.copy()
-                if converted_slice is not None: final_series.update(converted_slice)
-                new_col_name = "date"
-                counter = 1
-                other_columns = [c for c in df_copy.columns if c != col_name]
-                while new_col_name in other_columns:
-                    new_col_name = f"date_{counter}"; counter += 1
-                df_copy.insert(0, new_col_name, final_series)
-                df_copy = df_copy.drop(columns=[col_name])
+                step = make_step('convert_date', column=col_name, date_format=date_format_option, exclude_first_row=exclude_first_row)
+                df_copy = run_step(df, step)
+                new_col_name = df_copy.columns[0]
                 post_missing = df_copy[new_col_name].isnull().sum()
-                st.session_state.df = df_copy
+                commit_df(df_copy, f"日付型への変換: {col_name}", [new_col_name], step)
                 st.success(f"列「{col_name}」を日付型に変換し、「{new_col_name}」として先頭列に追加しました。")
                 if post_missing > pre_missing: st.warning(f"{post_missing - pre_missing}個のデータが変換に失敗し、欠損値になりました。")
                 st.rerun()
@@ -317,49 +386,128 @@ def display_column_wise_cleaning(df):
 
     if pd.api.types.is_string_dtype(df[selected_column]) or pd.api.types.is_object_dtype(df[selected_column]):
         with st.expander("文字列のクレンジング"):
-            # (文字列クレンジングのロジックは変更なし)
-            clean_option = st.selectbox("実行したいクレンジングを選択", ["---", "前後の空白を削除", "すべて小文字に変換", "すべて大文字に変換", "全角英数記号を半角に変換"], key=f"clean_{selected_column}")
+            clean_option = st.selectbox("実行したいクレンジングを選択", ["---"] + CLEAN_OPTIONS, key=f"clean_{selected_column}")
             if st.button("文字列クレンジングを実行", key=f"btn_clean_{selected_column}"):
                 if clean_option != "---":
-                    df_copy = df.copy()
-                    series_to_modify = df_copy[selected_column]
-                    target_slice = series_to_modify.iloc[1:] if exclude_first_row and len(series_to_modify) > 0 else series_to_modify
-                    processed_slice = None
-                    col = target_slice.astype(str)
-                    if clean_option == "前後の空白を削除": processed_slice = col.str.strip()
-                    elif clean_option == "すべて小文字に変換": processed_slice = col.str.lower()
-                    elif clean_option == "すべて大文字に変換": processed_slice = col.str.upper()
-                    elif clean_option == "全角英数記号を半角に変換": processed_slice = col.apply(lambda x: mojimoji.zen_to_han(x, kana=False))
-                    final_series = series_to_modify.copy()
-                    if processed_slice is not None: final_series.update(processed_slice)
-                    df_copy[selected_column] = final_series
-                    st.session_state.df = df_copy; st.success(f"「{selected_column}」列の「{clean_option}」を実行しました。"); st.rerun()
+                    step = make_step('clean_strings', column=selected_column, option=clean_option, exclude_first_row=exclude_first_row)
+                    commit_df(run_step(df, step), f"文字列クレンジング: {selected_column}", [selected_column], step); st.success(f"「{selected_column}」列の「{clean_option}」を実行しました。"); st.rerun()
+
+def display_batch_column_cleaning(df):
+    """「複数列の一括処理」セクションを表示する"""
+    st.header("📚 複数列の一括処理")
+    st.write("同じアクションを複数の列にまとめて実行します。列ごとの処理は並列に実行され、結果は1つの操作として履歴に記録されます。")
+    if 'batch_summary' in st.session_state:
+        st.write("前回の一括処理の結果"); st.dataframe(st.session_state.batch_summary)
+    batch_cols = st.multiselect("処理対象の列を複数選択", df.columns, key="batch_cols")
+    actions = {"欠損値の処理": 'fill_missing', "データ型の変換": 'convert_type', "日付型への変換": 'convert_date', "文字列のクレンジング": 'clean_strings'}
+    action = st.radio("実行するアクション", list(actions), horizontal=True, key="batch_action")
+    exclude_first_row = st.checkbox("最初のデータ行（0行目）を処理から除外する", key="batch_exclude_first")
+    if action == "欠損値の処理":
+        method = st.selectbox("欠損値をどうしますか？", FILL_METHODS, key="batch_fill_method", help="平均値・中央値は数値列のみに適用できます。")
+        params = {'method': method, 'value': st.text_input("埋める値を入力してください", key="batch_fill_value") if method == "指定した値で埋める" else None}
+    elif action == "データ型の変換": params = {'new_type': st.selectbox("変換したいデータ型を選択", TYPE_OPTIONS, key="batch_type")}
+    elif action == "日付型への変換": params = {'date_format': st.selectbox("データの形式を選択", DATE_FORMATS, key="batch_date")}
+    else: params = {'option': st.selectbox("実行したいクレンジングを選択", CLEAN_OPTIONS, key="batch_clean")}
+    params['exclude_first_row'] = exclude_first_row
+    if st.button("選択した列に一括実行"):
+        if not batch_cols: st.warning("列が選択されていません。"); return
+        op = actions[action]
+        with st.spinner(f"{len(batch_cols)}列を処理しています..."):
+            with st.session_state.profiler.section(f"apply_to_columns ({op})", "操作", df) as record:
+                new_df, summary = batch_apply(df, op, batch_cols, params); record.output = new_df
+        st.session_state.batch_summary = summary
+        succeeded = [col for col, result in zip(batch_cols, summary["結果"]) if result == "成功"]
+        if succeeded:
+            step = make_step('apply_to_columns', operation=op, columns=succeeded, params=params)
+            columns = None if op == 'convert_date' else succeeded
+            commit_df(new_df, f"一括処理（{action}）: {len(succeeded)}列", columns, step)
+        st.rerun()
 
-# (main, display_feature_engineering, display_variable_settings, display_download_button 関数は変更なし)
 def display_feature_engineering(df):
     st.header("🧮 特徴量エンジニアリング")
     st.write("機械学習モデルで使いやすいようにデータを変換します。")
     with st.expander("ワンホットエンコーディング"):
         categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
         ohe_cols = st.multiselect("ワンホットエンコーディングを適用したい列を複数選択", categorical_cols, key="ohe_cols")
+        col1, col2, col3 = st.columns(3)
+        ohe_dtype = col1.selectbox("ダミー列のデータ型", DUMMY_DTYPES, key="ohe_dtype", help="uint8 / bool は float64 の1/8のメモリで済みます。")
+        ohe_sparse = col1.checkbox("疎な形式（Sparse）で保持する", key="ohe_sparse", help="カテゴリの多い列でも、0以外の値だけを保持します。")
+        top_n = col2.number_input("カテゴリ数の上限（上位N件、0は無制限）", min_value=0, value=0, step=1, key="ohe_top_n")
+        min_frequency = col3.number_input("最小出現回数（0は無制限）", min_value=0, value=0, step=1, key="ohe_min_frequency")
+        st.caption(f"上限を超えたカテゴリや出現回数の少ないカテゴリは「{OTHER_LABEL}」列にまとめます。")
+        vocabulary_file = st.file_uploader("保存した語彙ファイル（JSON）を使う", type=['json'], key="ohe_vocabulary_file", help="別のファイルで作成した語彙を使うと、同じ列構成でエンコーディングできます。")
+        vocabulary, too_large = None, False
+        if ohe_cols:
+            try:
+                if vocabulary_file is not None:
+                    saved = decode_timestamps(json.loads(vocabulary_file.getvalue().decode('utf-8')))
+                    missing = [col for col in ohe_cols if str(col) not in saved]
+                    if missing: raise ValueError(f"語彙ファイルに次の列がありません: {missing}")
+                    vocabulary = {col: saved[str(col)] for col in ohe_cols}
+                else:
+                    vocabulary = {col: st.session_state.stats.column_stat(df, col, f'one_hot_{top_n}_{min_frequency}', lambda s: fit_one_hot(s.to_frame(), [s.name], top_n, min_frequency)[s.name]) for col in ohe_cols}
+                levels = sum(len(v) for v in vocabulary.values())
+                estimate = estimate_one_hot_bytes(df, ohe_cols, vocabulary, ohe_dtype, ohe_sparse)
+                st.write(f"追加されるダミー列: **{levels}** 列, 推定メモリ使用量: **{estimate / 1024 ** 2:.2f} MB**")
+                too_large = not ohe_sparse and estimate > ONE_HOT_DENSE_WARN_BYTES
+                if too_large:
+                    st.warning(f"推定メモリ使用量が {ONE_HOT_DENSE_WARN_BYTES // 1024 ** 2} MB を超えています。疎な形式（Sparse）にするか、カテゴリ数の上限を指定してください。")
+                st.download_button("語彙をJSONで保存", data=json.dumps(encode_timestamps({str(k): v for k, v in vocabulary.items()}), ensure_ascii=False, indent=2, default=str),
+                                   file_name="one_hot_vocabulary.json", mime="application/json")
+            except (ValueError, UnicodeDecodeError) as e:
+                st.error(f"語彙ファイルを読み込めませんでした: {e}"); vocabulary = None
+        confirmed = too_large and st.checkbox("密な形式のまま実行する", key="ohe_confirm_dense")
         if st.button("ワンホットエンコーディングを実行"):
-            if ohe_cols:
-                st.session_state.df = pd.get_dummies(df, columns=ohe_cols, dtype=float)
+            if too_large and not confirmed:
+                st.warning("推定メモリ使用量が大きいため実行しませんでした。密な形式のまま実行する場合は、確認のチェックを入れてください。")
+            elif ohe_cols and vocabulary is not None:
+                step = make_step('one_hot_encode', columns=ohe_cols, categories=vocabulary, dtype=ohe_dtype, sparse=ohe_sparse)
+                commit_df(run_step(df, step), "ワンホットエンコーディング", [], step)
                 st.success("ワンホットエンコーディングを実行しました。"); st.rerun()
-            else: st.warning("列が選択されていません。")
+            elif not ohe_cols: st.warning("列が選択されていません。")
     with st.expander("正規化・標準化"):
         numeric_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
-        scaling_method = st.radio("手法を選択してください", ("最小最大正規化 (Min-Max Scaling)", "標準化 (Standardization)"), key="scaling_method")
+        scaling_method = st.radio("手法を選択してください", SCALING_METHODS, key="scaling_method")
         numeric_cols_selected = st.multiselect("適用したい数値列を複数選択", numeric_cols, key="scaling_cols")
+        col1, col2 = st.columns(2)
+        scale_dtype = col1.selectbox("出力のデータ型", SCALE_DTYPES, key="scale_dtype", help="float32 にするとメモリ使用量が半分になります。")
+        scaler_name = col2.text_input("学習したスケーラーの名前", value=f"scaler_{len(st.session_state.scalers) + 1}", key="scaler_name")
         if st.button("正規化・標準化を実行"):
             if numeric_cols_selected:
-                df_copy = df.copy()
-                if scaling_method == "最小最大正規化 (Min-Max Scaling)": scaler = MinMaxScaler()
-                else: scaler = StandardScaler()
-                df_copy[numeric_cols_selected] = scaler.fit_transform(df_copy[numeric_cols_selected])
-                st.session_state.df = df_copy
+                scaler = scaler_to_dict(fit_scaler(df, numeric_cols_selected, scaling_method), scaling_method, numeric_cols_selected)
+                step = make_step('scale', columns=numeric_cols_selected, method=scaling_method, scaler=scaler, dtype=scale_dtype)
+                commit_df(run_step(df, step), scaling_method, numeric_cols_selected, step)
+                st.session_state.scalers[scaler_name or f"scaler_{len(st.session_state.scalers) + 1}"] = scaler
                 st.success(f"「{scaling_method}」を実行しました。"); st.rerun()
             else: st.warning("列が選択されていません。")
+        display_saved_scalers(df, scale_dtype)
+def display_saved_scalers(df, scale_dtype):
+    """学習済みスケーラーの一覧・再利用・書き出し・読み込み"""
+    st.markdown("**保存済みのスケーラー**")
+    uploaded = st.file_uploader("スケーラーを読み込む（JSON）", type=['json'], key="scaler_file")
+    if uploaded is not None and st.button("読み込んだスケーラーを追加"):
+        try:
+            artifact = json.loads(uploaded.getvalue().decode('utf-8'))
+            scaler_from_dict(artifact)
+            st.session_state.scalers[uploaded.name.rsplit('.', 1)[0]] = artifact; st.rerun()
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError) as e: st.error(f"スケーラーを読み込めませんでした: {e}")
+    if not st.session_state.scalers:
+        st.caption("正規化・標準化を実行すると、学習したパラメータがここに保存されます。"); return
+    name = st.selectbox("スケーラーを選択", list(st.session_state.scalers), key="saved_scaler")
+    artifact = st.session_state.scalers[name]
+    st.caption(f"手法: {artifact['method']} / 列: {', '.join(map(str, artifact['columns']))} / 学習した行数: {artifact['params'].get('n_samples_seen_')}")
+    missing = [col for col in artifact['columns'] if col not in df.columns]
+    col1, col2, col3 = st.columns(3)
+    if col1.button("このスケーラーで変換", disabled=bool(missing), help=f"次の列がありません: {missing}" if missing else None):
+        step = make_step('scale', columns=artifact['columns'], method=artifact['method'], scaler=artifact, dtype=scale_dtype)
+        commit_df(run_step(df, step), f"{artifact['method']}（{name}）", artifact['columns'], step)
+        st.success(f"スケーラー「{name}」で変換しました。"); st.rerun()
+    if col2.button("現在のデータで追加学習", disabled=bool(missing), help="現在のデータを partial_fit で追加し、パラメータを更新します（データは変換しません）。"):
+        scaler = fit_scaler(df, artifact['columns'], artifact['method'], scaler=scaler_from_dict(artifact))
+        st.session_state.scalers[name] = scaler_to_dict(scaler, artifact['method'], artifact['columns'])
+        st.success(f"スケーラー「{name}」を更新しました。"); st.rerun()
+    col3.download_button("JSONで書き出し", data=json.dumps(artifact, ensure_ascii=False, indent=2), file_name=f"{name}.json", mime="application/json")
+
 def display_variable_settings(df):
     st.header("🎯 目的変数と説明変数の設定")
     st.write("モデル学習に使用する変数（列）の役割を定義します。")
@@ -381,26 +529,33 @@ def display_variable_settings(df):
         else: st.warning("目的変数と説明変数を正しく選択してください。")
 def display_download_button(df):
     st.header("✅ 処理済みデータのダウンロード")
-    include_header = st.checkbox("ヘッダー行（カラム名）をCSVに含める", value=True)
-    @st.cache_data
-    def convert_df_to_csv_cached(df_to_convert, header_flag):
-        return df_to_convert.to_csv(index=False, header=header_flag).encode('utf-8-sig')
-    csv = convert_df_to_csv_cached(df, include_header)
-    st.download_button(label="整形済みデータをCSVでダウンロード", data=csv, file_name='cleaned_data.csv', mime='text/csv')
+    formats = list(EXPORT_FORMATS) if ARROW_AVAILABLE else ["CSV"]
+    fmt = st.radio("ファイル形式", formats, horizontal=True, help="Parquet / Feather はカテゴリ型や Int64 型などのデータ型を保ったまま保存できます。")
+    include_header, compression = True, None
+    if fmt == "CSV": include_header = st.checkbox("ヘッダー行（カラム名）をCSVに含める", value=True)
+    elif fmt == "Parquet": compression = st.selectbox("圧縮形式", PARQUET_COMPRESSIONS)
+    else: compression = st.selectbox("圧縮形式", FEATHER_COMPRESSIONS)
+    extension, mime = EXPORT_FORMATS[fmt]
+    # ファイルはダウンロードボタンが押されたときに作成する
+    profiler = st.session_state.profiler
+    def export():
+        with profiler.section(f"export ({fmt})", "書き出し", df):
+            return export_bytes(df, fmt, include_header, compression)
+    st.download_button(label=f"整形済みデータを{fmt.split(' ')[0]}でダウンロード", data=export,
+                       file_name=f'cleaned_data{extension}', mime=mime)
 def main():
     st.title("🛠️ データ前処理サポーター")
     st.write("CSVファイルをアップロードするだけで、データの健康診断とクリーニングができます。")
-    display_sidebar()
+    profiler = st.session_state.profiler
+    with profiler.section("display_sidebar", "描画", st.session_state.df): display_sidebar()
     if st.session_state.df is not None:
         df_main = st.session_state.df
-        display_health_check(df_main)
-        display_global_cleaning(df_main)
-        display_column_wise_cleaning(df_main)
-        display_feature_engineering(df_main)
-        display_variable_settings(df_main)
-        display_download_button(df_main)
+        for section in [display_health_check, display_global_cleaning, display_column_wise_cleaning, display_batch_column_cleaning,
+                        display_feature_engineering, display_variable_settings, display_download_button]:
+            with profiler.section(section.__name__, "描画", df_main): section(df_main)
     else:
         st.info("サイドバーからCSVファイルをアップロードして分析を開始してください。")
+    display_profiler_panel()
 
 if __name__ == "__main__":
     main()
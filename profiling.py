@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+操作と画面描画のプロファイリング
+各操作・各セクションの実行時間、メモリ使用量の変化、処理前後のデータの形を記録する。
+詳細モードでは、最も遅かった操作の cProfile または tracemalloc の結果を保存する。
+"""
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+MAX_RECORDS = 500
+DETAIL_MODES = ["cProfile", "tracemalloc"]
+DETAIL_LINES = 30
+# 処理中のピークメモリを調べる間隔（秒）
+PEAK_SAMPLE_INTERVAL = 0.01
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss_bytes():
+    """現在のメモリ使用量（Linux 以外では None）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _PeakSampler:
+    """
+    処理中のメモリ使用量の最大値を、別スレッドで一定間隔ごとに調べる。
+    プロセス全体の最大値（ru_maxrss）と違い、それ以前の処理の最大値に左右されない。
+    """
+    def __init__(self, interval=PEAK_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = _rss_bytes()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def stop(self):
+        """計測を終え、処理中の最大値（Linux 以外では None）を返す"""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+def _shape(df):
+    return None if df is None else f"{df.shape[0]} × {df.shape[1]}"
+
+
+def _mb(after, before):
+    return None if after is None or before is None else round((after - before) / 1024 ** 2, 2)
+
+
+class _Record:
+    """1回分の計測結果。output に処理後のデータフレームを設定すると、その形も記録する"""
+    def __init__(self, name, kind, df):
+        self.name = name
+        self.kind = kind
+        self.shape_before = _shape(df)
+        self.output = None
+
+
+class Profiler:
+    """
+    section() で囲んだ処理を計測して記録する。
+    detail に "cProfile" / "tracemalloc" を設定すると、操作ごとに詳細な計測も行い、最も遅い操作の結果を残す。
+    """
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self.detail = None
+        self.slowest = None
+
+    def clear(self):
+        self.records.clear()
+        self.slowest = None
+
+    @contextmanager
+    def section(self, name, kind, df=None):
+        record = _Record(name, kind, df)
+        detail = self.detail if kind == "操作" else None
+        profiler = cProfile.Profile() if detail == "cProfile" else None
+        own_trace = detail == "tracemalloc" and not tracemalloc.is_tracing()
+        if own_trace:
+            tracemalloc.start()
+        rss_before = _rss_bytes()
+        sampler = _PeakSampler()
+        started = datetime.datetime.now()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            # st.rerun() は例外で中断するため、finally で必ず記録する
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            peak = sampler.stop()
+            self.records.append({
+                '時刻': started.strftime('%H:%M:%S'), '種類': kind, '名前': name, '時間 (秒)': round(seconds, 4),
+                'メモリ増加 (MB)': _mb(_rss_bytes(), rss_before), 'ピーク増加 (MB)': _mb(peak, rss_before),
+                '処理前': record.shape_before, '処理後': _shape(record.output),
+            })
+            if detail and (self.slowest is None or seconds > self.slowest['seconds']):
+                self.slowest = {'name': name, 'seconds': seconds, 'mode': detail, 'report': self._detail_report(profiler, own_trace)}
+            if own_trace:
+                tracemalloc.stop()
+
+    @staticmethod
+    def _detail_report(profiler, own_trace):
+        if profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(DETAIL_LINES)
+            return out.getvalue()
+        if not own_trace:
+            return "tracemalloc は別の計測で使用中のため、スナップショットを取得できませんでした。"
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"確保中: {current / 1024 ** 2:.1f} MB, ピーク: {peak / 1024 ** 2:.1f} MB"]
+        for stat in tracemalloc.take_snapshot().statistics('lineno')[:DETAIL_LINES]:
+            lines.append(str(stat))
+        return "\n".join(lines)
+
+    def to_frame(self):
+        return pd.DataFrame(list(self.records))
+
+    def to_json(self):
+        """記録と最も遅い操作の詳細を、保存用のJSON文字列にする"""
+        return json.dumps({'records': list(self.records), 'slowest': self.slowest}, ensure_ascii=False, indent=2)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+前処理レシピ
+画面で実行した操作を「操作名 + パラメータ」のステップとして記録し、JSON/YAMLで保存・読み込みする。
+"""
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+
+import operations
+
+try:
+    import yaml
+except ImportError:  # YAMLはPyYAMLがインストールされている場合のみ対応
+    yaml = None
+
+RECIPE_VERSION = 1
+YAML_AVAILABLE = yaml is not None
+# 日付型の列のワンホットエンコーディングでは、語彙に Timestamp が入る。JSON/YAML にはこのキーを持つ辞書として書き出す
+TIMESTAMP_KEY = '__timestamp__'
+
+OPERATIONS = {
+    'set_header': operations.set_header,
+    'drop_columns': operations.drop_columns,
+    'drop_duplicates': operations.drop_duplicates,
+    'fill_missing': operations.fill_missing,
+    'convert_type': operations.convert_type,
+    'convert_date': operations.convert_date,
+    'clean_strings': operations.clean_strings,
+    'optimize_dtypes': operations.optimize_dtypes,
+    'one_hot_encode': operations.one_hot_encode,
+    'scale': operations.scale,
+    'column_arithmetic': operations.column_arithmetic,
+    'apply_to_columns': operations.apply_to_columns,
+}
+
+
+def _to_builtin(value):
+    """numpyの値やタプルなどを、JSON/YAMLに書き出せる型に変換する（日付は Timestamp にそろえる）"""
+    if isinstance(value, np.datetime64):
+        return pd.Timestamp(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_builtin(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_builtin(v) for k, v in value.items()}
+    return value
+
+
+def encode_timestamps(value):
+    """Timestamp を {TIMESTAMP_KEY: ISO形式の文字列} にして、JSON/YAMLに書き出せるようにする"""
+    if isinstance(value, datetime.datetime):
+        return {TIMESTAMP_KEY: pd.Timestamp(value).isoformat()}
+    if isinstance(value, (list, tuple)):
+        return [encode_timestamps(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encode_timestamps(v) for k, v in value.items()}
+    return value
+
+
+def decode_timestamps(value):
+    """encode_timestamps で書き出した値を元に戻す"""
+    if isinstance(value, dict):
+        if list(value) == [TIMESTAMP_KEY]:
+            return pd.Timestamp(value[TIMESTAMP_KEY])
+        return {k: decode_timestamps(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_timestamps(v) for v in value]
+    return value
+
+
+def make_step(op, **params):
+    """レシピのステップを作る"""
+    if op not in OPERATIONS:
+        raise ValueError(f"未対応の操作です: {op}")
+    return {'op': op, 'params': _to_builtin(params)}
+
+
+def apply_step(df, step):
+    return OPERATIONS[step['op']](df, **step['params'])
+
+
+def apply_recipe(df, steps):
+    for step in steps:
+        df = apply_step(df, step)
+    return df
+
+
+def dump_recipe(steps, fmt='json'):
+    """ステップのリストをレシピファイルの文字列にする"""
+    recipe = {'version': RECIPE_VERSION, 'steps': encode_timestamps(_to_builtin(list(steps)))}
+    if fmt == 'yaml':
+        if yaml is None:
+            raise RuntimeError("YAML形式で保存するには PyYAML をインストールしてください。")
+        return yaml.safe_dump(recipe, allow_unicode=True, sort_keys=False)
+    return json.dumps(recipe, ensure_ascii=False, indent=2)
+
+
+def load_recipe(text):
+    """レシピファイルの文字列（JSONまたはYAML）を読み込み、ステップのリストを返す"""
+    try:
+        recipe = json.loads(text)
+    except json.JSONDecodeError:
+        if yaml is None:
+            raise ValueError("JSONとして読み込めませんでした（YAMLを読み込むには PyYAML が必要です）。")
+        recipe = yaml.safe_load(text)
+    if not isinstance(recipe, dict) or not isinstance(recipe.get('steps'), list):
+        raise ValueError("レシピの形式が正しくありません。")
+    if recipe.get('version', RECIPE_VERSION) > RECIPE_VERSION:
+        raise ValueError(f"このレシピはより新しいバージョン ({recipe['version']}) で作成されています。")
+    steps = decode_timestamps(recipe['steps'])
+    for step in steps:
+        if step.get('op') not in OPERATIONS:
+            raise ValueError(f"未対応の操作です: {step.get('op')}")
+        step.setdefault('params', {})
+    return steps
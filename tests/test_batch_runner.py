@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""batch_runner.RecipeRunner のチャンク単位の出力が、画面でファイル全体に実行した結果と一致することを確かめる"""
+import io
+
+import pandas as pd
+import pytest
+
+from batch_runner import RecipeRunner
+from csv_loader import load_csv
+from recipes import apply_recipe, make_step
+
+# 数十行ずつのチャンクに分かれるよう、チャンクの大きさを小さくする
+CHUNK_BYTES = 1024
+
+
+def write_csv(path, rows):
+    path.write_text("\n".join(",".join(row) for row in rows) + "\n", encoding='utf-8')
+    return path
+
+
+def interactive_csv(path, steps):
+    """画面と同じく、ファイル全体を読み込んでからレシピを適用した結果のCSV"""
+    with open(path, 'rb') as f:
+        df = load_csv(f).df
+    return apply_recipe(df, steps).to_csv(index=False)
+
+
+def batch_csv(path, steps, tmp_path, chunk_bytes=CHUNK_BYTES):
+    output = tmp_path / "output.csv"
+    RecipeRunner(steps, chunk_bytes=chunk_bytes).run(path, output)
+    return output.read_text(encoding='utf-8-sig')
+
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    rows = [["説明行", "", "", "", ""], ["店舗", "金額", "数量", "区分", "日付"]]
+    for i in range(300):
+        amount = "" if i % 17 == 0 else f'"{(i * 37 % 50 + 1) * 100:,}円"'
+        quantity = "" if i % 11 == 0 else str(i % 4 + 1)
+        rows.append([f"店{i % 7}", amount, quantity, ["A", "B", "Ｃ", ""][i % 4], f"令和{i % 5 + 1}年{i % 12 + 1}月{i % 28 + 1}日"])
+    rows += rows[5:40]  # 別のチャンクに重複行を入れる
+    return write_csv(tmp_path / "sales.csv", rows)
+
+
+def test_recipe_matches_interactive_result(sales_csv, tmp_path):
+    steps = [
+        make_step('set_header', row=1),
+        make_step('convert_type', column='金額', new_type='数値 (float)'),
+        make_step('optimize_dtypes', conversions=[{'column': '数量', 'dtype': 'float64'}]),
+        make_step('clean_strings', column='区分', option='全角英数記号を半角に変換'),
+        make_step('fill_missing', column='数量', method='平均値で埋める'),
+        make_step('convert_date', column='日付', date_format="日本の形式 (例: 2023年1月1日, 令和5年1月1日)"),
+        make_step('drop_duplicates'),
+        make_step('one_hot_encode', columns=['店舗'], dtype='uint8'),
+        make_step('scale', columns=['金額'], method="標準化 (Standardization)"),
+    ]
+    # 平均値とスケーラーはチャンクごとに集計するため、浮動小数点の最後の桁だけ異なることがある
+    pd.testing.assert_frame_equal(pd.read_csv(io.StringIO(batch_csv(sales_csv, steps, tmp_path))),
+                                  pd.read_csv(io.StringIO(interactive_csv(sales_csv, steps))))
+
+
+@pytest.mark.parametrize("keep", ['first', 'last'])
+def test_duplicates_across_chunks(sales_csv, tmp_path, keep):
+    steps = [make_step('set_header', row=1), make_step('drop_duplicates', subset=['店舗', '区分'], keep=keep)]
+    assert batch_csv(sales_csv, steps, tmp_path) == interactive_csv(sales_csv, steps)
+
+
+def test_float_conversion_does_not_depend_on_chunk_contents(tmp_path):
+    # 先頭のチャンクには空欄がなく、後ろのチャンクにだけ空欄がある
+    rows = [["コード", "値"]] + [[f"c{i}", "" if i > 250 and i % 3 == 0 else f"{i}個"] for i in range(300)]
+    path = write_csv(tmp_path / "values.csv", rows)
+    steps = [make_step('set_header', row=0), make_step('convert_type', column='値', new_type='数値 (float)'),
+             make_step('drop_duplicates', subset=['値'])]
+    output = batch_csv(path, steps, tmp_path)
+    assert output == interactive_csv(path, steps)
+    assert "\nc1,1.0\n" in output
+
+
+def test_apply_to_columns_matches_interactive_result(sales_csv, tmp_path):
+    steps = [
+        make_step('set_header', row=1),
+        make_step('apply_to_columns', operation='convert_type', columns=['金額', '数量'], params={'new_type': '数値 (float)', 'exclude_first_row': True}),
+    ]
+    assert batch_csv(sales_csv, steps, tmp_path) == interactive_csv(sales_csv, steps)
+
+
+def test_one_hot_of_partially_converted_column(tmp_path):
+    # 一部だけ数値に変換できた列は数値と文字列が混在し、カテゴリは出現順になる
+    rows = [["区分"]] + [[["3", "不明", "1", "対象外", "2"][i % 5] if i > 100 else ["3", "1"][i % 2]] for i in range(300)]
+    path = write_csv(tmp_path / "mixed.csv", rows)
+    steps = [make_step('set_header', row=0), make_step('convert_type', column='区分', new_type='数値 (float)'),
+             make_step('one_hot_encode', columns=['区分'], dtype='uint8')]
+    assert batch_csv(path, steps, tmp_path) == interactive_csv(path, steps)
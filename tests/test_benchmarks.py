@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""benchmarks のレポート比較のテスト"""
+import benchmarks
+
+
+def report(seconds, peak_mb):
+    return {'results': [{'operation': 'scale', 'rows': 10000, 'seconds': seconds, 'peak_mb': peak_mb}]}
+
+
+def test_reports_large_regressions():
+    assert benchmarks.compare(report(0.5, 300.0), report(0.2, 100.0)) == [
+        ('scale', 10000, 'seconds', 0.2, 0.5), ('scale', 10000, 'peak_mb', 100.0, 300.0),
+    ]
+
+
+def test_ignores_differences_below_floor():
+    # 倍率では 2 倍でも、数ミリ秒・1 MB 未満の差はばらつきとみなす
+    assert benchmarks.compare(report(0.004, 0.8), report(0.002, 0.4)) == []
+    assert benchmarks.compare(report(0.004, 0.8), report(0.002, 0.4), floors={}) != []
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""csv_loader の文字コード判定とブロックごとの読み込みのテスト"""
+import io
+import warnings
+
+import pandas as pd
+import pytest
+
+import csv_loader
+from csv_loader import SAMPLE_SIZE, detect_encoding, iter_csv_chunks, load_csv
+
+# 数十行ずつのブロックに分かれるよう、ブロックの大きさを小さくする
+CHUNK_BYTES = 256
+
+
+def read_whole(data, engine='c'):
+    """ファイル全体を1回でパースした結果（ブロックに分けた読み込みと比べる）"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.ParserWarning)
+        bad_lines = 'warn' if engine == 'c' else (lambda line: None)
+        df = pd.read_csv(io.BytesIO(data), header=None, dtype=str, engine=engine, on_bad_lines=bad_lines)
+    return csv_loader._infer_dtypes(df)
+
+
+def sample_csv(rows=200):
+    # 13行に1行は、引用符の中に改行を含む
+    notes = ["改行を含む\nメモ" if i % 13 == 0 else "メモ" for i in range(rows)]
+    lines = ["店舗,金額,備考"] + [f'店{i % 7},{i * 10},"{note}{i}"' for i, note in enumerate(notes)]
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+@pytest.mark.parametrize("sample, expected", [
+    (b'\xef\xbb\xbfa,b\n', 'utf-8-sig'),
+    ("列,値\n".encode('utf-8'), 'utf-8'),
+    ("列,値\n".encode('cp932'), 'cp932'),
+    (b'a,b\n' + "あ".encode('utf-8')[:-1], 'utf-8'),  # サンプルの末尾でマルチバイト文字が途切れた場合
+    (b'a,b\n' + "あ".encode('cp932')[:-1], 'cp932'),
+])
+def test_detect_encoding(sample, expected):
+    assert detect_encoding(sample) == expected
+
+
+def test_blocks_match_whole_file():
+    data = sample_csv()
+    progress = []
+    result = load_csv(io.BytesIO(data), progress_callback=progress.append, chunk_bytes=CHUNK_BYTES)
+    pd.testing.assert_frame_equal(result.df, read_whole(data))
+    assert (result.encoding, result.engine, result.bad_lines) == ('utf-8', 'c', 0)
+    assert len(progress) > 1 and progress == sorted(progress) and progress[-1] == 1.0
+
+
+@pytest.mark.parametrize("encoding, expected", [('cp932', 'cp932'), ('utf-8-sig', 'utf-8-sig')])
+def test_encodings(encoding, expected):
+    data = sample_csv().decode('utf-8').encode(encoding)
+    result = load_csv(io.BytesIO(data), chunk_bytes=CHUNK_BYTES)
+    assert result.encoding == expected
+    pd.testing.assert_frame_equal(result.df, read_whole(sample_csv()))
+
+
+def test_retries_when_encoding_changes_after_sample():
+    # 判定に使うサンプルはASCIIだけで、その後に Shift-JIS の文字がある
+    data = b'a,b\n' + b'x,1\n' * (SAMPLE_SIZE // 4) + "店,2\n".encode('cp932')
+    result = load_csv(io.BytesIO(data))
+    assert result.encoding == 'cp932'
+    assert result.df.iloc[-1].tolist() == ["店", "2"]
+
+
+def test_counts_bad_lines_across_blocks():
+    lines = ["a,b,c"] + [f"{i},{i},{i}" if i % 9 else f"{i},{i},{i},extra" for i in range(200)]
+    data = ("\n".join(lines) + "\n").encode('utf-8')
+    result = load_csv(io.BytesIO(data), chunk_bytes=CHUNK_BYTES)
+    assert result.bad_lines == len(range(0, 200, 9))
+    pd.testing.assert_frame_equal(result.df, read_whole(data))
+
+
+def test_python_engine_only_for_failing_block(monkeypatch):
+    # 閉じていない引用符はCエンジンで解析できないが、その前のブロックはCエンジンのまま読む
+    data = sample_csv() + b'x,1,"unclosed\ny,2,z\n'
+    blocks = []
+    read_python = csv_loader._read_python_engine
+    monkeypatch.setattr(csv_loader, '_read_python_engine', lambda f, enc, size, cb: blocks.append(size) or read_python(f, enc, size, cb))
+    result = load_csv(io.BytesIO(data), chunk_bytes=CHUNK_BYTES)
+    assert result.engine == 'python'
+    assert len(blocks) == 1 and blocks[0] < len(data) // 4
+    pd.testing.assert_frame_equal(result.df, read_whole(data, engine='python'))
+
+
+def test_iter_csv_chunks_numbers_rows_continuously():
+    chunks = [df for df, _ in iter_csv_chunks(io.BytesIO(sample_csv()), chunk_bytes=CHUNK_BYTES)]
+    assert len(chunks) > 1
+    pd.testing.assert_index_equal(pd.concat(chunks).index, pd.RangeIndex(201))
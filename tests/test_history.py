@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""history.DataHistory の差分による元に戻す／やり直すが、元のデータフレームを復元することを確かめる"""
+import gc
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import operations
+from history import DataHistory
+
+
+@pytest.fixture
+def raw():
+    rows = [["説明", None, None], ["店舗", "金額", "区分"]]
+    rows += [[f"店{i % 3}", f"{(i % 5) * 100}円" if i % 4 else None, "ＡＢ"[i % 2]] for i in range(20)]
+    return pd.DataFrame(rows, dtype=object)
+
+
+def run_operations(df):
+    """(新しいデータフレーム, ラベル, 値が変わった既存列) を順に返す"""
+    df = operations.set_header(df, 1)
+    yield df, "ヘッダー行の設定", None
+    df = operations.convert_type(df, "金額", "数値 (float)")
+    yield df, "型変換", ["金額"]
+    df = operations.clean_strings(df, "区分", "全角英数記号を半角に変換")
+    yield df, "文字列クレンジング", ["区分"]
+    df = operations.fill_missing(df, "金額", "行ごと削除する")
+    yield df, "欠損値処理", ["金額"]
+    df = operations.drop_duplicates(df)
+    yield df, "重複行の削除", []
+    df = operations.one_hot_encode(df, ["店舗"], dtype='uint8')
+    yield df, "ワンホットエンコーディング", []
+
+
+def record(history, df):
+    states = [df]
+    for new_df, label, columns in run_operations(df):
+        history.push(states[-1], new_df, label, columns)
+        states.append(new_df)
+    return states
+
+
+def test_undo_and_redo_restore_every_state(raw):
+    history = DataHistory()
+    states = record(history, raw)
+    df = states[-1]
+    for expected in reversed(states[:-1]):
+        df = history.undo(df)
+        pd.testing.assert_frame_equal(df, expected)
+    assert not history.can_undo
+    for expected in states[1:]:
+        df = history.redo(df)
+        pd.testing.assert_frame_equal(df, expected)
+    assert not history.can_redo
+
+
+def test_undo_all_returns_first_state(raw):
+    history = DataHistory()
+    states = record(history, raw)
+    pd.testing.assert_frame_equal(history.undo_all(states[-1]), raw)
+    assert history.last_columns is None
+
+
+def test_push_clears_redo(raw):
+    history = DataHistory()
+    states = record(history, raw)
+    previous = history.undo(states[-1])
+    history.push(previous, operations.drop_columns(previous, ["区分"]), "列の一括削除", [])
+    assert not history.can_redo
+    assert history.undo_labels[-1] == "列の一括削除"
+
+
+def test_column_delta_keeps_only_changed_columns(raw):
+    df = operations.set_header(raw, 1)
+    converted = operations.convert_type(df, "金額", "数値 (float)")
+    history = DataHistory()
+    history.push(df, converted, "型変換", ["金額"])
+    assert list(history._undo[-1].delta.data) == ["金額"]
+    pd.testing.assert_frame_equal(history.undo(converted), df)
+
+
+def test_snapshots_are_kept_by_reference():
+    # 列名が重複していると差分で表せないため、データフレーム全体を保持する
+    old = pd.DataFrame(np.arange(6).reshape(3, 2), columns=["a", "a"])
+    new = old.iloc[::-1]
+    history = DataHistory()
+    history.push(old, new, "並べ替え")
+    assert history.undo(new) is old
+
+
+def test_budget_evicts_oldest_steps(raw):
+    history = DataHistory()
+    states = record(history, raw)
+    history.max_bytes = history._undo[-1].nbytes
+    assert history.evicted > 0
+    assert history.nbytes <= history.max_bytes
+    assert len(history.undo_labels) == len(states) - 1
+    df = states[-1]
+    while history.can_undo:
+        df = history.undo(df)
+    pd.testing.assert_frame_equal(df, states[history.evicted])
+
+
+def test_retained_memory_matches_reported_size():
+    # 差分の列が元のデータフレームのブロック全体を参照したままだと、nbytes より多くのメモリが残る
+    tracemalloc.start()
+    try:
+        df = pd.DataFrame(np.random.default_rng(0).random((50000, 20)), columns=[f"c{i}" for i in range(20)])
+        history = DataHistory()
+        for i in range(5):
+            new_df = operations.convert_type(df, f"c{i}", "数値 (float)")
+            history.push(df, new_df, "型変換", [f"c{i}"])
+            df = new_df
+        del new_df
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        reported = history.nbytes
+        history.clear()
+        gc.collect()
+        freed = before - tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert freed < reported * 1.5
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""japanese_dates.parse_japanese_dates が従来の1件ずつの変換と同じ結果になることを確かめる"""
+import pandas as pd
+import pytest
+
+from japanese_dates import parse_japanese_dates
+
+
+def legacy_convert_japanese_date(jp_date_text):
+    """ベクトル化する前の変換（1件ずつ pd.to_datetime を試す）"""
+    if not isinstance(jp_date_text, str): return None
+    text = jp_date_text.replace('元年', '1年')
+    try: return pd.to_datetime(text, format='%Y年%m月%d日')
+    except ValueError:
+        try: return pd.to_datetime(text, format='%Y年%m月')
+        except ValueError:
+            try: return pd.to_datetime(text, format='%Y年')
+            except ValueError:
+                year_str = text.split('年')[0]; year = 0
+                if '令和' in year_str: year = int(year_str.replace('令和', '')) + 2018
+                elif '平成' in year_str: year = int(year_str.replace('平成', '')) + 1988
+                elif '昭和' in year_str: year = int(year_str.replace('昭和', '')) + 1925
+                elif '大正' in year_str: year = int(year_str.replace('大正', '')) + 1911
+                elif '明治' in year_str: year = int(year_str.replace('明治', '')) + 1867
+                if year == 0: return None
+                try:
+                    month_day_part = text.split('年')[1]
+                    if '日' in month_day_part: month, day = int(month_day_part.split('月')[0]), int(month_day_part.split('月')[1].replace('日', ''))
+                    else: month, day = int(month_day_part.replace('月', '')), 1
+                    return pd.to_datetime(f'{year}-{month}-{day}')
+                except (IndexError, ValueError): return pd.to_datetime(f'{year}-01-01')
+
+
+CASES = [
+    "2023年1月1日", "2023年12月31日", "2023年1月", "2023年", "2023年2月30日", "23年1月1日",
+    "令和5年1月1日", "令和元年5月1日", "令和5年1月", "令和5年", "平成元年", "平成31年4月30日", "平成10年3月",
+    "昭和64年1月7日", "昭和50年6月15日", "大正15年12月25日", "明治45年7月30日",
+    "令和5年2月30日", "令和5年13月", "令和5年1月1日です",
+    "abc", "", "2023-01-01",
+]
+
+
+def test_matches_legacy_parser():
+    s = pd.Series(CASES + [None, "令和5年1月1日"], dtype=object)
+    expected = pd.to_datetime(s.apply(legacy_convert_japanese_date), errors='coerce')
+    pd.testing.assert_series_equal(parse_japanese_dates(s), expected, check_names=False)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("令和元年", "2019-01-01"),
+    ("平成31年4月30日", "2019-04-30"),
+    ("令和5年2月30日", "2023-01-01"),  # 和暦で日付が不正な場合はその年の1月1日
+])
+def test_era_dates(text, expected):
+    assert parse_japanese_dates(pd.Series([text]))[0] == pd.Timestamp(expected)
+
+
+def test_keeps_index_and_handles_empty():
+    s = pd.Series(["2023年1月1日", None], index=[10, 20], dtype=object)
+    result = parse_japanese_dates(s)
+    assert result.index.tolist() == [10, 20]
+    assert pd.isna(result[20])
+    assert parse_japanese_dates(pd.Series([], dtype=object)).dtype == 'datetime64[ns]'
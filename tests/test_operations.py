@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""operations の純粋関数のテスト"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import operations
+
+KEEP_OPTIONS = ['first', 'last', False]
+
+DUPLICATE_FRAMES = {
+    'numbers': pd.DataFrame({'a': [1, 2, 1, 2, 3], 'b': [0.5, np.nan, 0.5, np.nan, 0.5]}),
+    'strings': pd.DataFrame({'a': ["x", "y", "x", None, None], 'b': ["1", "1", "1", "2", "2"]}),
+    'int_and_str': pd.DataFrame({'a': [1, "1", 1, "1", None]}, dtype=object),
+    'int_float_bool': pd.DataFrame({'a': [1, 1.0, True, np.int64(1), 0, False, 2.5, 2.5]}, dtype=object),
+    'timestamp_and_str': pd.DataFrame({'a': [pd.Timestamp('2023-01-01'), '2023-01-01', pd.Timestamp('2023-01-01')]}, dtype=object),
+    'missing_kinds': pd.DataFrame({'a': [1, "a", None, np.nan, pd.NaT, 1.0, None]}, dtype=object),
+    'categorical': pd.DataFrame({'a': pd.Categorical(["x", "y", "x"]), 'b': [1, 2, 1]}),
+    'nullable': pd.DataFrame({'a': pd.array([1, None, 1, None], dtype='Int64'), 'b': ["p", "q", "p", "q"]}),
+}
+
+
+@pytest.mark.parametrize("keep", KEEP_OPTIONS)
+@pytest.mark.parametrize("name", list(DUPLICATE_FRAMES))
+def test_duplicated_matches_pandas(name, keep):
+    df = DUPLICATE_FRAMES[name]
+    pd.testing.assert_series_equal(operations.duplicated(df, keep=keep), df.duplicated(keep=keep))
+
+
+@pytest.mark.parametrize("keep", KEEP_OPTIONS)
+def test_duplicated_with_subset_matches_pandas(keep):
+    df = pd.DataFrame({'key': ["a", "b", "a", "b", "c"], 'value': [1, 2, 3, 4, 5]}, index=[10, 11, 12, 13, 14])
+    pd.testing.assert_series_equal(operations.duplicated(df, ['key'], keep), df.duplicated(['key'], keep=keep))
+
+
+@pytest.mark.parametrize("keep", KEEP_OPTIONS)
+def test_drop_duplicates_matches_pandas(keep):
+    df = DUPLICATE_FRAMES['numbers']
+    pd.testing.assert_frame_equal(operations.drop_duplicates(df, keep=keep), df.drop_duplicates(keep=keep))
+
+
+def test_row_hashes_do_not_depend_on_chunking():
+    # バッチ実行ではチャンクごとにハッシュを求めるため、行のハッシュは他の行に依存してはならない
+    # 部分的に数値へ変換した列では、チャンクによって文字列だけ・数値だけ・混在のどれにもなる
+    df = pd.DataFrame({'a': ["1", "x", 1.0, 2.0, 1, "1", None, "x"], 'b': list("pqpqpqpq")}, dtype=object)
+    chunks = np.concatenate([operations.row_hashes(df.iloc[i:i + 2]) for i in range(0, len(df), 2)])
+    np.testing.assert_array_equal(chunks, operations.row_hashes(df))
+    assert operations.duplicated(df, ['a'], keep=False).tolist() == df.duplicated(['a'], keep=False).tolist()
+
+
+@pytest.mark.parametrize("values", [
+    [3, "b", 1, "a", None, 3],
+    [pd.Timestamp('2023-01-02'), "不明", pd.Timestamp('2023-01-01')],
+    ["b", "a", "b"],
+])
+def test_one_hot_categories_match_get_dummies(values):
+    # 数値と文字列が混在して並べ替えられない列でも、get_dummies と同じ列になる
+    series = pd.Series(values, dtype=object, name="列")
+    expected = pd.get_dummies(series.to_frame(), columns=["列"]).columns.tolist()
+    assert [f"列_{c}" for c in operations.one_hot_categories(series)] == expected
+    encoded = operations.one_hot_encode(series.to_frame(), ["列"], categories=operations.fit_one_hot(series.to_frame(), ["列"]))
+    assert encoded.columns.tolist() == expected
+
+
+def legacy_parse_numbers(series):
+    """文字列を経由していた従来の数値変換"""
+    return pd.to_numeric(series.astype(str).str.replace(r'[^\d.-]', '', regex=True), errors='coerce')
+
+
+NUMBER_SERIES = {
+    'integers': pd.Series([1, 2, -3]),
+    'floats': pd.Series([1.5, np.nan, -0.25, 1e20, 1e-7, 0.0, np.inf]),
+    'float32': pd.Series([1.5, 2.25, np.nan], dtype='float32'),
+    'uint64': pd.Series([2 ** 63 + 1, 5], dtype='uint64'),
+    'nullable_int': pd.Series([1, None, 3], dtype='Int64'),
+    'plain_strings': pd.Series(["1", "2", "-30"]),
+    'decimal_strings': pd.Series(["1.5", "2", None, "-0.5"]),
+    'units': pd.Series(["1,234円", "12%", "約5", "abc", "", "1.2.3", "--1", "-5"]),
+    'exponents': pd.Series(["1e5", "1E-3", "2.5e+3", "e", "1e5円"]),
+    'infinity': pd.Series(["inf", "-inf", "Infinity", "nan", "NaN"]),
+    'underscores': pd.Series(["1_000", "2_0"]),
+    'category': pd.Series(["1", "2", "x", "1"], dtype='category'),
+    'mixed_object': pd.Series([1, "2", 3.5, None, True, "4円", np.nan], dtype=object),
+}
+
+
+@pytest.mark.parametrize("name", list(NUMBER_SERIES))
+def test_parse_numbers_matches_legacy(name):
+    series = NUMBER_SERIES[name]
+    pd.testing.assert_series_equal(operations.parse_numbers(series), legacy_parse_numbers(series), check_names=False)
+
+
+def test_parse_numbers_converts_full_width_digits():
+    # 従来の変換では全角数字を読めなかったが、全角英数記号を半角にしてから読む
+    assert operations.parse_numbers(pd.Series(["１２３", "４．５円"])).tolist() == [123.0, 4.5]
+
+
+@pytest.mark.parametrize("new_type, expected", [
+    ("数値 (float)", ["単位", 1.0, 25.0, "不明", 1000.0]),
+    ("数値 (int)", ["単位", 1, 25, "不明", 1000]),
+])
+def test_convert_type_writes_by_position(new_type, expected):
+    # インデックスが重複していても、0行目を除外した位置どおりに書き込む
+    df = pd.DataFrame({'値': ["単位", "1", "25", "不明", "1,000"]}, index=[0, 1, 1, 0, 2])
+    result = operations.convert_type(df, '値', new_type, exclude_first_row=True)
+    assert result.index.tolist() == [0, 1, 1, 0, 2]
+    assert result['値'].tolist() == expected
+    assert [type(v).__name__ for v in result['値'].tolist()] == [type(v).__name__ for v in expected]
+    assert operations.convert_type(df, '値', new_type)['値'].iloc[0] == "単位"
+
+
+def legacy_summary(op, params, before, after):
+    """要素ごとに object 型で比べていた従来の集計"""
+    a, b = after.astype(object).to_numpy(), before.astype(object).to_numpy()
+    a_missing, b_missing = pd.isna(a), pd.isna(b)
+    both = ~a_missing & ~b_missing
+    changed = int((a_missing != b_missing).sum() + (a[both] != b[both]).sum())
+    unconverted = 0
+    if op == 'fill_missing':
+        unconverted = int(after.isna().sum())
+    elif op == 'convert_type' and params['new_type'] in ["数値 (int)", "数値 (float)"]:
+        unconverted = int((pd.to_numeric(after, errors='coerce').isna() & after.notna()).sum())
+    elif op == 'convert_date' and after.dtype == object:
+        unconverted = int((after.notna() & ~after.map(lambda v: isinstance(v, pd.Timestamp))).sum())
+    return changed, unconverted
+
+
+SUMMARY_CASES = [
+    ('convert_type', {'new_type': "数値 (int)"}, 'units'),
+    ('convert_type', {'new_type': "数値 (float)"}, 'decimal_strings'),
+    ('convert_type', {'new_type': "数値 (float)"}, 'integers'),
+    ('convert_type', {'new_type': "数値 (float)"}, 'uint64'),
+    ('convert_type', {'new_type': "数値 (float)"}, 'mixed_object'),
+    ('convert_type', {'new_type': "数値 (float)", 'exclude_first_row': True}, 'units'),
+    ('convert_type', {'new_type': "数値 (int)"}, 'category'),
+    ('convert_type', {'new_type': "文字列 (str)"}, 'floats'),
+    ('convert_type', {'new_type': "カテゴリカル (category)"}, 'units'),
+    ('fill_missing', {'method': "平均値で埋める", 'value': None}, 'floats'),
+    ('fill_missing', {'method': "指定した値で埋める", 'value': "0"}, 'decimal_strings'),
+    ('clean_strings', {'option': "全角英数記号を半角に変換"}, 'units'),
+    ('convert_date', {'date_format': "区切り文字なし (例: 20230101)"}, 'dates'),
+    ('convert_date', {'date_format': "Excelのシリアル値 (例: 45123)"}, 'integers'),
+]
+
+
+@pytest.mark.parametrize("op, params, name", SUMMARY_CASES)
+def test_batch_summary_matches_legacy(op, params, name):
+    series = pd.Series(["20230101", "2023年", None, "20231231"]) if name == 'dates' else NUMBER_SERIES[name]
+    frame = series.to_frame('値')
+    result, changed, unconverted, error = operations._apply_single_column(op, '値', params, frame)
+    assert error is None
+    assert (changed, unconverted) == legacy_summary(op, params, frame['値'], result.iloc[:, 0])
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""profiling.Profiler の計測のテスト"""
+import time
+
+import numpy as np
+import pytest
+
+from profiling import Profiler, _rss_bytes
+
+
+def allocate(mb):
+    """mb MB の配列を確保して値を書き込み、少し待ってから解放する"""
+    values = np.ones(mb * 1024 ** 2 // 8)
+    time.sleep(0.05)
+    return float(values[-1])
+
+
+@pytest.mark.skipif(_rss_bytes() is None, reason="メモリ使用量を取得できない環境です")
+def test_peak_is_measured_per_section():
+    # プロセス全体の最大値を使うと、前の操作より小さい操作のピーク増加が0になってしまう
+    profiler = Profiler()
+    with profiler.section("large", "操作"):
+        allocate(200)
+    with profiler.section("small", "操作"):
+        allocate(100)
+    large, small = profiler.records
+    assert large['ピーク増加 (MB)'] > 150
+    assert small['ピーク増加 (MB)'] > 75
+    assert small['メモリ増加 (MB)'] < 50
+
+
+def test_records_section_names():
+    profiler = Profiler()
+    with profiler.section("noop", "描画") as record:
+        record.output = None
+    assert profiler.to_frame()['名前'].tolist() == ["noop"]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""recipes の保存・読み込みのテスト"""
+import pandas as pd
+import pytest
+
+import operations
+from recipes import YAML_AVAILABLE, apply_recipe, dump_recipe, load_recipe, make_step
+
+
+@pytest.fixture
+def dated():
+    # 日付型への変換で読めなかった値は文字列のまま残り、Timestamp と文字列が混在する列になる
+    df = pd.DataFrame({'日付': ["令和5年1月1日", "不明", "令和5年1月2日", "令和5年1月1日"], '値': [1, 2, 3, 4]})
+    return operations.convert_date(df, '日付', "日本の形式 (例: 2023年1月1日, 令和5年1月1日)")
+
+
+@pytest.mark.parametrize("fmt", ['json', pytest.param('yaml', marks=pytest.mark.skipif(not YAML_AVAILABLE, reason="PyYAML がありません"))])
+def test_one_hot_step_with_timestamps_round_trips(dated, fmt):
+    categories = operations.fit_one_hot(dated, ['date'])
+    assert any(isinstance(c, pd.Timestamp) for c in categories['date'])
+    steps = [make_step('one_hot_encode', columns=['date'], categories=categories, dtype='uint8')]
+    loaded = load_recipe(dump_recipe(steps, fmt=fmt))
+    assert loaded == steps
+    pd.testing.assert_frame_equal(apply_recipe(dated, loaded), apply_recipe(dated, steps))
+
+
+def test_numpy_datetimes_are_stored_as_timestamps():
+    step = make_step('one_hot_encode', columns=['date'], categories={'date': [pd.Timestamp('2023-01-01').to_datetime64()]})
+    assert step['params']['categories']['date'] == [pd.Timestamp('2023-01-01')]
+    assert load_recipe(dump_recipe([step])) == [step]
+
+
+def test_rejects_unknown_operation():
+    with pytest.raises(ValueError):
+        load_recipe('{"version": 1, "steps": [{"op": "unknown"}]}')
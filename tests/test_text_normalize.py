@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""text_normalize.zen_to_han が mojimoji.zen_to_han(kana=False) と同じ結果になることを確かめる"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from text_normalize import zen_to_han
+
+
+def test_matches_mojimoji_for_every_bmp_character():
+    mojimoji = pytest.importorskip('mojimoji')
+    chars = [chr(c) for c in range(0x20, 0x10000) if not 0xd800 <= c < 0xe000]
+    result = zen_to_han(pd.Series(chars, dtype=object))
+    assert result.tolist() == [mojimoji.zen_to_han(c, kana=False) for c in chars]
+
+
+def test_matches_mojimoji_for_mixed_text():
+    mojimoji = pytest.importorskip('mojimoji')
+    texts = ["ＡＢＣ１２３", "１，２３４円", "　全角スペース　", "カタカナはそのまま", "ｈｔｔｐｓ：／／ｅｘａｍｐｌｅ．ｃｏｍ", "abc"]
+    assert zen_to_han(pd.Series(texts)).tolist() == [mojimoji.zen_to_han(t, kana=False) for t in texts]
+
+
+def test_keeps_missing_values_and_index():
+    s = pd.Series(["ＡＢＣ", np.nan, "ＡＢＣ"], index=[3, 1, 2], name="列")
+    result = zen_to_han(s)
+    assert result.tolist()[::2] == ["ABC", "ABC"]
+    assert pd.isna(result[1])
+    assert result.index.tolist() == [3, 1, 2]
+    assert result.name == "列"
+
+
+def test_returns_copy_when_nothing_to_translate():
+    s = pd.Series(["abc", "def"])
+    result = zen_to_han(s)
+    assert result.tolist() == ["abc", "def"]
+    assert result is not s
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+全角→半角の正規化
+mojimoji.zen_to_han(x, kana=False) と同じ変換を、変換表とstr.translateで一括処理する。
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# zen_to_han(kana=False) が変換する文字の一覧（カタカナは変換しない）
+_ZEN_TO_HAN = {
+    '‘': '`', '’': "'", '”': '"', '　': ' ', '￥': '¥',
+    '！': '!',
+}
+_ZEN_TO_HAN.update({chr(c): chr(c - 0xfee0) for c in range(0xff03, 0xff07)})  # ＃＄％＆
+_ZEN_TO_HAN.update({chr(c): chr(c - 0xfee0) for c in range(0xff08, 0xff40)})  # （ 〜 ＿
+_ZEN_TO_HAN.update({chr(c): chr(c - 0xfee0) for c in range(0xff41, 0xff5f)})  # ａ 〜 ～
+
+ZEN_TO_HAN_TABLE = str.maketrans(_ZEN_TO_HAN)
+_ZENKAKU_PATTERN = re.compile('[' + re.escape(''.join(_ZEN_TO_HAN)) + ']')
+
+
+def zen_to_han(s):
+    """
+    文字列のSeriesの全角英数記号を半角に変換する。
+    同じ値は1回だけ変換し、変換対象の文字を含まない値はそのまま返す。
+    """
+    codes, uniques = pd.factorize(s)
+    if len(uniques) == 0:
+        return s.copy()
+    uniques = pd.Series(uniques, dtype=object)
+    needs_translation = uniques.str.contains(_ZENKAKU_PATTERN, na=False)
+    if not needs_translation.any():
+        return s.copy()
+    uniques[needs_translation] = uniques[needs_translation].str.translate(ZEN_TO_HAN_TABLE)
+    values = uniques.to_numpy()[codes]
+    values[codes < 0] = np.nan
+    return pd.Series(values, index=s.index, name=s.name, dtype=object)